@@ -6,7 +6,19 @@ from bot.services.user_service import UserService
 from bot.services.room_service import RoomService
 from bot.services.file_service import FileService
 from bot.services.ai_service import AIService
+from bot.services.ai_cache import AICache
+from bot.services.ai_limiter import AILimiter
+from bot.services.extraction_service import ExtractionService
+from bot.services.tag_batcher import TagBatcher
+from bot.services.ai_quota import AIQuota
+from bot.services.room_replica import RoomReplica
+from bot.services.text_cache import TextCache
+from bot.services.search_cache import SearchCache
+from bot.services.room_resolver import RoomResolver
+from bot.services.trigram_index import TrigramIndex
+from bot.services.similarity_index import SimilarityIndex
 from config import settings
+from typing import Optional
 import logging
 
 logger = logging.getLogger(__name__)
@@ -66,28 +78,34 @@ async def dashboard(request: Request):
         "total_rooms": total_rooms,
         "total_files": total_files,
         "total_ai_calls": total_ai_calls,
+        "ai_cache": AICache.stats(),
+        "ai_inflight": AIService.inflight_stats(),
+        "text_cache": TextCache.stats(),
+        "search_cache": SearchCache.stats(),
+        "room_resolver": RoomResolver.stats(),
+        "trigram_index": TrigramIndex.stats(),
+        "similarity_index": SimilarityIndex.stats(),
         "active_page": "dashboard"
     })
 
 
 @router.get("/users", response_class=HTMLResponse)
-async def users_page(request: Request, page: int = 1):
+async def users_page(request: Request, cursor: Optional[str] = None):
     """Users management page"""
     if not require_auth(request):
         return RedirectResponse(url="/admin/login", status_code=302)
     
     per_page = 20
-    skip = (page - 1) * per_page
     
-    users = await UserService.get_all_users(skip=skip, limit=per_page)
+    users, next_cursor = await UserService.get_all_users_page(cursor=cursor, limit=per_page)
     total = await UserService.count_users()
-    total_pages = (total + per_page - 1) // per_page
     
     return templates.TemplateResponse("users.html", {
         "request": request,
         "users": users,
-        "page": page,
-        "total_pages": total_pages,
+        "total": total,
+        "cursor": cursor,
+        "next_cursor": next_cursor,
         "active_page": "users"
     })
 
@@ -103,23 +121,48 @@ async def update_user_role(user_id: int, role: str = Form(...)):
 
 
 @router.get("/rooms", response_class=HTMLResponse)
-async def rooms_page(request: Request, page: int = 1):
+async def rooms_page(request: Request, cursor: Optional[str] = None):
     """Rooms management page"""
     if not require_auth(request):
         return RedirectResponse(url="/admin/login", status_code=302)
     
     per_page = 20
-    skip = (page - 1) * per_page
     
-    rooms = await RoomService.get_all_rooms(skip=skip, limit=per_page)
+    rooms, next_cursor = await RoomService.get_all_rooms_page(cursor=cursor, limit=per_page)
     total = await RoomService.count_rooms()
-    total_pages = (total + per_page - 1) // per_page
     
     return templates.TemplateResponse("rooms.html", {
         "request": request,
         "rooms": rooms,
-        "page": page,
-        "total_pages": total_pages,
+        "total": total,
+        "cursor": cursor,
+        "next_cursor": next_cursor,
+        "active_page": "rooms"
+    })
+
+
+@router.get("/rooms/{code}/members", response_class=HTMLResponse)
+async def room_members_page(request: Request, code: str, cursor: Optional[str] = None):
+    """Room members page"""
+    if not require_auth(request):
+        return RedirectResponse(url="/admin/login", status_code=302)
+    
+    per_page = 50
+    
+    room = await RoomService.get_room(code)
+    if not room:
+        raise HTTPException(status_code=404, detail="Room not found")
+    
+    members, next_cursor = await RoomService.get_members_page(code, cursor=cursor, limit=per_page)
+    users = await UserService.get_users([m.user_id for m in members])
+    
+    return templates.TemplateResponse("room_members.html", {
+        "request": request,
+        "room": room,
+        "members": members,
+        "users": users,
+        "cursor": cursor,
+        "next_cursor": next_cursor,
         "active_page": "rooms"
     })
 
@@ -132,23 +175,22 @@ async def deactivate_room(code: str):
 
 
 @router.get("/files", response_class=HTMLResponse)
-async def files_page(request: Request, page: int = 1):
+async def files_page(request: Request, cursor: Optional[str] = None):
     """Files management page"""
     if not require_auth(request):
         return RedirectResponse(url="/admin/login", status_code=302)
     
     per_page = 20
-    skip = (page - 1) * per_page
     
-    files = await FileService.get_all_files(skip=skip, limit=per_page)
+    files, next_cursor = await FileService.get_all_files_page(cursor=cursor, limit=per_page)
     total = await FileService.count_all_files()
-    total_pages = (total + per_page - 1) // per_page
     
     return templates.TemplateResponse("files.html", {
         "request": request,
         "files": files,
-        "page": page,
-        "total_pages": total_pages,
+        "total": total,
+        "cursor": cursor,
+        "next_cursor": next_cursor,
         "active_page": "files"
     })
 
@@ -164,10 +206,19 @@ async def settings_page(request: Request):
         "ai_max_tokens": settings.AI_MAX_TOKENS,
         "ai_temperature": settings.AI_TEMPERATURE,
         "ai_calls_per_day": settings.AI_CALLS_PER_USER_PER_DAY,
+        "ai_rate_limit": settings.AI_RATE_LIMIT_PER_SECOND,
+        "ai_rate_burst": settings.AI_RATE_BURST,
+        "ai_concurrency_min": settings.AI_CONCURRENCY_MIN,
+        "ai_concurrency_max": settings.AI_CONCURRENCY_MAX,
     }
     
     return templates.TemplateResponse("settings.html", {
         "request": request,
         "settings": current_settings,
+        "limiter": AILimiter.stats(),
+        "extraction": ExtractionService.stats(),
+        "tag_batches": TagBatcher.stats(),
+        "ai_quota": AIQuota.stats(),
+        "room_replica": RoomReplica.stats(),
         "active_page": "settings"
     })
\ No newline at end of file
@@ -0,0 +1,92 @@
+"""
+Cost of turning a 1k-row page of file documents into listing objects.
+
+    python benchmarks/bench_records.py [--rows 1000] [--repeat 20]
+
+Compares validated File models built from full documents, File.model_construct
+and FileRecord built from documents fetched with FileRecord.PROJECTION. Reports
+BSON bytes per page, the median build time and the memory retained by the page.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "bench")
+os.environ.setdefault("AI_API_KEY", "bench")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bson  # noqa: E402
+from bson import ObjectId  # noqa: E402
+
+from bot.models import File, FileRecord  # noqa: E402
+
+
+def make_docs(rows: int):
+    """Full file documents as stored, and the same page as fetched with PROJECTION"""
+    now = datetime.utcnow()
+    docs = []
+    for i in range(rows):
+        docs.append({
+            "_id": ObjectId(),
+            "file_id": f"BQACAgIAAxkBAAI{i:010d}" + "x" * 40,
+            "file_unique_id": f"AgAD{i:08d}",
+            "file_type": "document",
+            "file_name": f"lecture_{i}_linear_algebra_notes.pdf",
+            "caption": "Week notes on eigenvalues, eigenvectors and diagonalisation " * 2,
+            "uploader_id": 100000 + i % 50,
+            "room_code": "ROOM42",
+            "tags": ["math", "linear-algebra", "notes"],
+            "ai_tags": ["eigenvalues", "matrices", "diagonalisation", "exam-prep"],
+            "created_at": now - timedelta(minutes=i),
+            "message_id": 5000 + i,
+        })
+    projected = [{key: doc[key] for key in FileRecord.PROJECTION if key in doc} | {"_id": doc["_id"]}
+                 for doc in docs]
+    return docs, projected
+
+
+def measure(build, docs, repeat: int):
+    """Median build time in ms, and KiB still allocated while the page is held"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        build(docs)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    page = build(docs)
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del page
+    return statistics.median(timings), retained / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    docs, projected = make_docs(args.rows)
+    full_bytes = sum(len(bson.encode(doc)) for doc in docs)
+    projected_bytes = sum(len(bson.encode(doc)) for doc in projected)
+
+    cases = [
+        ("File(**doc)", lambda page: [File(**doc) for doc in page], docs, full_bytes),
+        ("File.model_construct", lambda page: [File.model_construct(**doc) for doc in page], docs, full_bytes),
+        ("FileRecord(doc)", lambda page: [FileRecord(doc) for doc in page], projected, projected_bytes),
+    ]
+    print(f"{args.rows} rows per page")
+    print(f"{'builder':<22} {'BSON KiB':>9} {'build ms':>9} {'retained KiB':>13}")
+    for name, build, page, wire_bytes in cases:
+        build_ms, retained_kib = measure(build, page, args.repeat)
+        print(f"{name:<22} {wire_bytes / 1024:>9.0f} {build_ms:>9.2f} {retained_kib:>13.0f}")
+
+
+if __name__ == "__main__":
+    main()
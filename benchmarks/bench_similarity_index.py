@@ -0,0 +1,101 @@
+"""
+Build and query cost of the /similar TF-IDF index for synthetic rooms.
+
+    python benchmarks/bench_similarity_index.py [--sizes 10000 100000] [--text-share 0.2]
+
+Reports build time, index memory, median/p95 similar() latency and the longest
+event-loop stall while the build runs in a worker thread (as SimilarityIndex._load does).
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+import zlib
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "bench")
+os.environ.setdefault("AI_API_KEY", "bench")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId  # noqa: E402
+
+from bot.services.similarity_index import RoomSimilarityIndex  # noqa: E402
+
+
+def make_room(size: int, text_share: float, text_words: int, seed: int = 1):
+    """Synthetic files with Zipf-like word use, and compressed text for a share of them"""
+    rng = random.Random(seed)
+    vocabulary = [f"term{i}" for i in range(20000)]
+    cumulative, total = [], 0.0
+    for rank in range(len(vocabulary)):
+        total += 1 / (rank + 1)
+        cumulative.append(total)
+
+    def words(n):
+        return rng.choices(vocabulary, cum_weights=cumulative, k=n)
+
+    docs, texts = [], {}
+    for i in range(size):
+        unique_id = f"u{i}"
+        docs.append({
+            "_id": ObjectId(),
+            "file_unique_id": unique_id,
+            "file_name": "_".join(words(3)) + ".pdf",
+            "caption": " ".join(words(12)),
+            "tags": words(3),
+            "ai_tags": words(4),
+        })
+        if rng.random() < text_share:
+            texts[unique_id] = zlib.compress(" ".join(words(text_words)).encode("utf-8"))
+    return docs, texts
+
+
+async def build_off_loop(docs, texts):
+    """Build in a thread while measuring how long the event loop is ever blocked"""
+    stalls = []
+
+    async def ticker():
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(0.005)
+            stalls.append(time.perf_counter() - started - 0.005)
+
+    task = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    index = await asyncio.to_thread(RoomSimilarityIndex.build, docs, texts)
+    elapsed = time.perf_counter() - started
+    task.cancel()
+    return index, elapsed, max(stalls, default=0.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--text-share", type=float, default=0.2, help="share of files with extracted text")
+    parser.add_argument("--text-words", type=int, default=300, help="words of extracted text per file")
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'files':>8} {'build s':>8} {'loop stall ms':>14} {'memory MB':>10} {'p50 ms':>8} {'p95 ms':>8}")
+    for size in args.sizes:
+        docs, texts = make_room(size, args.text_share, args.text_words)
+        index, build_seconds, stall = asyncio.run(build_off_loop(docs, texts))
+
+        rng = random.Random(2)
+        latencies = []
+        for _ in range(args.queries):
+            file_id = rng.choice(docs)["_id"]
+            started = time.perf_counter()
+            index.similar(file_id, 5)
+            latencies.append((time.perf_counter() - started) * 1000)
+        latencies.sort()
+
+        print(f"{size:>8} {build_seconds:>8.2f} {stall * 1000:>14.1f} "
+              f"{index.memory_bytes() / 1024 / 1024:>10.1f} "
+              f"{statistics.median(latencies):>8.2f} {latencies[int(len(latencies) * 0.95)]:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
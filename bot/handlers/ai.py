@@ -1,14 +1,24 @@
 from telegram import Update
+from telegram.error import RetryAfter, TelegramError
 from telegram.ext import ContextTypes, CommandHandler
 from bot.services.user_service import UserService
 from bot.services.room_service import RoomService
 from bot.services.ai_service import AIService
+from bot.services.ai_quota import AIQuota, Reservation
 from bot.services.file_service import FileService
+from bot.services.extraction_service import ExtractionService
+from bot.services.text_cache import TextCache
+from bot.services.download_service import DownloadService, FileTooLargeError
+from config import settings
+from typing import Optional, Tuple
 import logging
-import io
+import time
 
 logger = logging.getLogger(__name__)
 
+# Max characters shown while an AI answer is still streaming (Telegram limit is 4096)
+STREAM_PREVIEW_CHARS = 3500
+
 
 async def summarise_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /summarise or /summarize command"""
@@ -48,18 +58,34 @@ async def _handle_ai_command(update: Update, context: ContextTypes.DEFAULT_TYPE,
         )
         return
     
-    # Check rate limit
-    if not await AIService.check_rate_limit(user.id):
-        usage = await AIService.get_usage_count(user.id)
+    # Reserve a call against the daily limit
+    reservation = await AIQuota.reserve(user.id, command)
+    if reservation is None:
         await message.reply_text(
-            f"❌ Daily AI limit reached ({usage} calls).\n"
+            f"❌ Daily AI limit reached ({settings.AI_CALLS_PER_USER_PER_DAY} calls).\n"
             "Try again tomorrow or contact admin."
         )
         return
     
+    try:
+        await _run_ai_command(update, context, command, num_questions, reservation)
+    finally:
+        # Hand back the call unless it produced a new AI answer
+        await reservation.refund()
+
+
+async def _run_ai_command(update: Update, context: ContextTypes.DEFAULT_TYPE, command: str,
+                          num_questions: int, reservation: Reservation):
+    """Extract the replied-to text and run the AI command on it"""
+    message = update.message
+    
     # Extract text
     replied_msg = message.reply_to_message
-    text = await _extract_text_from_message(replied_msg, context)
+    try:
+        text = await _extract_text_from_message(replied_msg, context, AIService.input_budget(command))
+    except FileTooLargeError as e:
+        await message.reply_text(f"❌ {e}")
+        return
     
     if not text:
         await message.reply_text(
@@ -72,18 +98,20 @@ async def _handle_ai_command(update: Update, context: ContextTypes.DEFAULT_TYPE,
     processing_msg = await message.reply_text("🤖 Processing with AI... Please wait.")
     
     try:
-        # Call appropriate AI service
+        # Call appropriate AI service, streaming partial output into the processing message
+        on_chunk = _progress_editor(processing_msg, command)
         if command == "summarise":
-            result = await AIService.summarise(text)
+            result, cached = await AIService.summarise(text, on_chunk=on_chunk)
         elif command == "explain":
-            result = await AIService.explain(text)
+            result, cached = await AIService.explain(text, on_chunk=on_chunk)
         elif command == "quiz":
-            result = await AIService.generate_mcqs(text, num_questions)
+            result, cached = await AIService.generate_mcqs(text, num_questions, on_chunk=on_chunk)
         else:
-            result = "Unknown command"
+            result, cached = "Unknown command", True
         
-        # Increment usage
-        await AIService.increment_usage(user.id, command)
+        # Keep the reserved call (cache hits are free and get refunded)
+        if not cached:
+            reservation.commit()
         
         # Send result
         await processing_msg.edit_text(
@@ -99,8 +127,40 @@ async def _handle_ai_command(update: Update, context: ContextTypes.DEFAULT_TYPE,
         )
 
 
-async def _extract_text_from_message(message, context) -> str:
-    """Extract text from a message (text, caption, or document)"""
+def _progress_editor(processing_msg, command: str):
+    """
+    Build an on_chunk callback that progressively edits the processing message,
+    throttled to AI_STREAM_EDIT_INTERVAL to stay within Telegram edit limits.
+    """
+    parts = []
+    next_edit_at = 0.0
+    
+    async def on_chunk(delta: str):
+        nonlocal next_edit_at
+        parts.append(delta)
+        
+        now = time.monotonic()
+        if now < next_edit_at:
+            return
+        next_edit_at = now + settings.AI_STREAM_EDIT_INTERVAL
+        
+        preview = "".join(parts)
+        if len(preview) > STREAM_PREVIEW_CHARS:
+            preview = "…" + preview[-STREAM_PREVIEW_CHARS:]
+        
+        # Plain text: partial output may contain unbalanced Markdown
+        try:
+            await processing_msg.edit_text(f"🤖 AI {command.title()} (writing...)\n\n{preview}")
+        except RetryAfter as e:
+            next_edit_at = time.monotonic() + float(e.retry_after)
+        except TelegramError as e:
+            logger.debug(f"Progressive edit skipped: {e}")
+    
+    return on_chunk
+
+
+async def _extract_text_from_message(message, context, max_chars: int) -> str:
+    """Extract up to about max_chars of text from a message (text, caption, or document)"""
     # Direct text
     if message.text:
         return message.text
@@ -109,38 +169,50 @@ async def _extract_text_from_message(message, context) -> str:
     if message.caption:
         return message.caption
     
-    # Document - try to extract text
+    # Document - reuse text already extracted for this file, otherwise download and parse
     if message.document:
-        try:
-            file = await context.bot.get_file(message.document.file_id)
-            file_bytes = io.BytesIO()
-            await file.download_to_memory(file_bytes)
-            file_bytes.seek(0)
-            
-            # Try to read as text
-            if message.document.file_name.endswith('.txt'):
-                return file_bytes.read().decode('utf-8', errors='ignore')
-            
-            # Basic PDF support (requires PyPDF2)
-            if message.document.file_name.endswith('.pdf'):
-                try:
-                    import PyPDF2
-                    pdf_reader = PyPDF2.PdfReader(file_bytes)
-                    text = ""
-                    for page in pdf_reader.pages[:10]:  # Limit to first 10 pages
-                        text += page.extract_text()
-                    return text
-                except Exception as e:
-                    logger.error(f"PDF extraction failed: {e}")
-                    return None
-            
-        except Exception as e:
-            logger.error(f"Document text extraction failed: {e}")
-            return None
+        document = message.document
+        cached = await TextCache.get(document.file_unique_id, max_chars)
+        if cached is not None:
+            return cached
+        
+        text, complete = await _extract_document_text(document, context, max_chars)
+        if text:
+            await TextCache.set(document.file_unique_id, text, complete)
+        return text
     
     return None
 
 
+async def _extract_document_text(document, context, max_chars: int) -> Tuple[Optional[str], bool]:
+    """
+    Download a document and extract up to about max_chars of its text.
+    Returns (text, complete) where complete is True if the whole document was read.
+    """
+    file_name = document.file_name or ""
+    if not file_name.endswith(('.txt', '.pdf')):
+        return None, False
+    
+    try:
+        with await DownloadService.download(context.bot, document) as spool:
+            # Try to read as text (UTF-8 is at most 4 bytes per character)
+            if file_name.endswith('.txt'):
+                data, complete = spool.read_head(max_chars * 4)
+                return data.decode('utf-8', errors='ignore')[:max_chars], complete
+            
+            # Basic PDF support (requires PyPDF2), parsed page by page off the event loop.
+            # Large downloads spilled to disk are mmapped by the worker instead of copied.
+            source = spool.getvalue() if spool.in_memory else spool.path
+            result = await ExtractionService.extract_pdf(source, max_chars)
+            return result if result else (None, False)
+        
+    except FileTooLargeError:
+        raise
+    except Exception as e:
+        logger.error(f"Document text extraction failed: {e}")
+        return None, False
+
+
 # Handler registration
 ai_handlers = [
     CommandHandler("summarise", summarise_command),
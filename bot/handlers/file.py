@@ -1,9 +1,9 @@
 from telegram import Update
 from telegram.ext import ContextTypes, CommandHandler, MessageHandler, filters
-from bot.services.user_service import UserService
-from bot.services.room_service import RoomService
+from bot.services.room_resolver import RoomResolver
 from bot.services.file_service import FileService
-from bot.services.ai_service import AIService
+from bot.services.tag_batcher import TagBatcher
+from bot.services.tag_service import TagService
 import logging
 
 logger = logging.getLogger(__name__)
@@ -16,7 +16,7 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     document = message.document
     
     # Determine room
-    room_code = await _get_room_for_message(update, user.id)
+    room_code = await RoomResolver.resolve(update.effective_chat, user.id)
     
     if not room_code:
         await message.reply_text(
@@ -27,39 +27,45 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Save file
     caption = message.caption or ""
-    file = await FileService.save_file(
+    file, created = await FileService.save_file(
         file_id=document.file_id,
         file_type="document",
         room_code=room_code,
         uploader_id=user.id,
         file_name=document.file_name,
         caption=caption,
-        message_id=message.message_id
+        message_id=message.message_id,
+        file_unique_id=document.file_unique_id
     )
     
-    # Optionally suggest tags using AI
-    if caption:
-        try:
-            suggested_tags = await AIService.suggest_tags(caption)
-            if suggested_tags:
-                await FileService.add_tags(document.file_id, suggested_tags)
-                await message.reply_text(
-                    f"✅ File uploaded successfully!\n\n"
-                    f"📎 **File:** {document.file_name}\n"
-                    f"🏷️ **AI-suggested tags:** {', '.join(suggested_tags)}\n\n"
-                    f"Reply to this file with `/add_tags` to add more tags.",
-                    parse_mode="Markdown"
-                )
-                return
-        except Exception as e:
-            logger.error(f"Tag suggestion failed: {e}")
+    if not created:
+        await message.reply_text(
+            f"ℹ️ This file is already in the room.\n\n"
+            f"📎 **File:** {file.file_name}",
+            parse_mode="Markdown"
+        )
+        return
     
-    await message.reply_text(
+    uploaded_text = (
         f"✅ File uploaded successfully!\n\n"
         f"📎 **File:** {document.file_name}\n"
-        f"Reply to this file with `/add_tags tag1, tag2` to organize it.",
+    )
+    reply = await message.reply_text(
+        uploaded_text + "Reply to this file with `/add_tags tag1, tag2` to organize it.",
         parse_mode="Markdown"
     )
+    
+    # Suggest tags using AI in the background, batched with other uploads to the room
+    if caption:
+        async def show_tags(suggested_tags):
+            await reply.edit_text(
+                uploaded_text +
+                f"🏷️ **AI-suggested tags:** {', '.join(suggested_tags)}\n\n"
+                f"Reply to this file with `/add_tags` to add more tags.",
+                parse_mode="Markdown"
+            )
+        
+        TagBatcher.submit(room_code, document.file_unique_id, caption, on_tags=show_tags)
 
 
 async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -69,7 +75,7 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     photo = message.photo[-1]  # Get highest resolution
     
     # Determine room
-    room_code = await _get_room_for_message(update, user.id)
+    room_code = await RoomResolver.resolve(update.effective_chat, user.id)
     
     if not room_code:
         await message.reply_text(
@@ -80,16 +86,21 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Save file
     caption = message.caption or "Photo"
-    await FileService.save_file(
+    _, created = await FileService.save_file(
         file_id=photo.file_id,
         file_type="photo",
         room_code=room_code,
         uploader_id=user.id,
         file_name="photo.jpg",
         caption=caption,
-        message_id=message.message_id
+        message_id=message.message_id,
+        file_unique_id=photo.file_unique_id
     )
     
+    if not created:
+        await message.reply_text("ℹ️ This photo is already in the room.")
+        return
+    
     await message.reply_text(
         "✅ Photo uploaded successfully!\n"
         "Reply with `/add_tags` to add tags.",
@@ -118,7 +129,7 @@ async def add_tags_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # Get room
-    room_code = await _get_room_for_message(update, user.id)
+    room_code = await RoomResolver.resolve(update.effective_chat, user.id)
     if not room_code:
         await message.reply_text("❌ You're not in any room.")
         return
@@ -135,18 +146,21 @@ async def add_tags_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Get file
     replied_msg = message.reply_to_message
     file_id = None
+    file_unique_id = None
     
     if replied_msg.document:
         file_id = replied_msg.document.file_id
+        file_unique_id = replied_msg.document.file_unique_id
     elif replied_msg.photo:
         file_id = replied_msg.photo[-1].file_id
+        file_unique_id = replied_msg.photo[-1].file_unique_id
     
     if not file_id:
         await message.reply_text("❌ Replied message doesn't contain a supported file.")
         return
     
     # Add tags
-    await FileService.add_tags(file_id, tags)
+    await FileService.add_tags(room_code, file_id, tags, file_unique_id=file_unique_id)
     
     await message.reply_text(
         f"✅ Added tags: {', '.join(tags)}",
@@ -154,18 +168,33 @@ async def add_tags_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
-async def _get_room_for_message(update: Update, user_id: int) -> str:
-    """Determine which room a message belongs to"""
-    chat = update.effective_chat
-    
-    # If private chat, use user's current room
-    if chat.type == "private":
-        user_data = await UserService.get_user(user_id)
-        return user_data.current_room_code if user_data else None
-    
-    # If group chat, find linked room
-    room = await RoomService.get_room_by_chat_id(chat.id)
-    return room.code if room else None
+async def tags_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /tags command (list the room's tags, or those starting with a prefix)"""
+    user = update.effective_user
+    message = update.message
+    
+    room_code = await RoomResolver.resolve(update.effective_chat, user.id)
+    if not room_code:
+        await message.reply_text("❌ You're not in any room.")
+        return
+    
+    if context.args:
+        prefix = " ".join(context.args)
+        tags = await TagService.suggest_tags(room_code, prefix, limit=20)
+        header = f"🏷️ **Tags starting with** `{prefix}`:"
+    else:
+        tags = await TagService.get_top_tags(room_code)
+        header = "🏷️ **Most used tags in this room:**"
+    
+    if not tags:
+        await message.reply_text("🏷️ No tags found. Reply to a file with `/add_tags` to add some.", parse_mode="Markdown")
+        return
+    
+    tags_text = "\n".join(f"• `{tag}` ({count})" for tag, count in tags)
+    await message.reply_text(
+        f"{header}\n\n{tags_text}\n\nUse `/search <tag>` to find files.",
+        parse_mode="Markdown"
+    )
 
 
 # Handler registration
@@ -173,4 +202,5 @@ file_handlers = [
     MessageHandler(filters.Document.ALL, handle_document),
     MessageHandler(filters.PHOTO, handle_photo),
     CommandHandler("add_tags", add_tags_command),
+    CommandHandler("tags", tags_command),
 ]
\ No newline at end of file
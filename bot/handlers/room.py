@@ -117,7 +117,7 @@ async def join_room_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # Join room
-    await RoomService.join_room(code, user.id)
+    joined = await RoomService.join_room(code, user.id)
     await UserService.update_current_room(user.id, code)
     
     await update.message.reply_text(
@@ -125,7 +125,7 @@ async def join_room_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"**Room Name:** {room.name}\n"
         f"**Room Code:** `{room.code}`\n"
         f"**Description:** {room.description or 'None'}\n"
-        f"**Members:** {len(room.members) + 1}\n\n"
+        f"**Members:** {room.member_count + (1 if joined else 0)}\n\n"
         f"You can now upload files and use all features.",
         parse_mode="Markdown"
     )
@@ -157,7 +157,7 @@ async def my_room_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"**Name:** {room.name}\n"
         f"**Code:** `{room.code}`\n"
         f"**Description:** {room.description or 'None'}\n"
-        f"**Members:** {len(room.members)}\n"
+        f"**Members:** {room.member_count}\n"
         f"**Your Role:** {'👑 Owner' if is_owner else '👤 Member'}\n"
         f"**Linked to Group:** {'Yes' if room.linked_chat_id else 'No'}",
         parse_mode="Markdown"
@@ -1,8 +1,8 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, CommandHandler, CallbackQueryHandler
-from bot.services.user_service import UserService
-from bot.services.room_service import RoomService
+from bot.services.room_resolver import RoomResolver
 from bot.services.search_service import SearchService
+from bot.services.tag_service import TagService
 import logging
 
 logger = logging.getLogger(__name__)
@@ -25,13 +25,7 @@ async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = " ".join(context.args)
     
     # Get room
-    chat = update.effective_chat
-    if chat.type == "private":
-        user_data = await UserService.get_user(user.id)
-        room_code = user_data.current_room_code if user_data else None
-    else:
-        room = await RoomService.get_room_by_chat_id(chat.id)
-        room_code = room.code if room else None
+    room_code = await RoomResolver.resolve(update.effective_chat, user.id)
     
     if not room_code:
         await update.message.reply_text(
@@ -40,25 +34,36 @@ async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
     
-    # Search
-    files = await SearchService.search_files(room_code, query, skip=0, limit=RESULTS_PER_PAGE)
-    total = await SearchService.count_search_results(room_code, query)
+    # Search once and keep the ordered result ids server-side for pagination
+    token, files, total, capped = await SearchService.create_session(
+        room_code, query, limit=RESULTS_PER_PAGE
+    )
     
     if not files:
-        await update.message.reply_text(
-            f"🔍 No results found for: *{query}*",
-            parse_mode="Markdown"
-        )
+        no_results_text = f"🔍 No results found for: *{query}*"
+        suggestions = await TagService.suggest_tags(room_code, query.split()[0])
+        if suggestions:
+            no_results_text += "\n\n💡 Tags in this room: " + ", ".join(
+                f"`{tag}` ({count})" for tag, count in suggestions
+            )
+        await update.message.reply_text(no_results_text, parse_mode="Markdown")
         return
     
     # Display results
-    await _display_search_results(update, files, query, room_code, page=0, total=total)
+    await _display_search_results(update, room_code, files, query, token, page=0, total=total, capped=capped)
 
 
-async def _display_search_results(update, files, query, room_code, page, total):
+async def _display_search_results(update, room_code, files, query, token, page, total, capped=False):
     """Display search results with pagination"""
     result_text = f"🔍 **Search Results for:** {query}\n"
-    result_text += f"Found {total} file(s)\n\n"
+    result_text += f"Found {total}{'+' if capped else ''} file(s)\n"
+    
+    # Room-wide file counts for the tags on this page
+    tag_counts = await TagService.get_tag_counts(room_code, [t for f in files for t in f.tags + f.ai_tags])
+    if tag_counts:
+        top_tags = sorted(tag_counts.items(), key=lambda item: -item[1])[:5]
+        result_text += "🏷️ " + ", ".join(f"{tag} ({count})" for tag, count in top_tags) + "\n"
+    result_text += "\n"
     
     for idx, file in enumerate(files, start=page * RESULTS_PER_PAGE + 1):
         tags_display = ", ".join(file.tags + file.ai_tags) if (file.tags or file.ai_tags) else "No tags"
@@ -73,10 +78,10 @@ async def _display_search_results(update, files, query, room_code, page, total):
     nav_buttons = []
     
     if page > 0:
-        nav_buttons.append(InlineKeyboardButton("◀️ Previous", callback_data=f"search_prev_{page}_{query}_{room_code}"))
+        nav_buttons.append(InlineKeyboardButton("◀️ Previous", callback_data=f"search_prev_{page}_{token}"))
     
     if (page + 1) * RESULTS_PER_PAGE < total:
-        nav_buttons.append(InlineKeyboardButton("Next ▶️", callback_data=f"search_next_{page}_{query}_{room_code}"))
+        nav_buttons.append(InlineKeyboardButton("Next ▶️", callback_data=f"search_next_{page}_{token}"))
     
     if nav_buttons:
         keyboard.append(nav_buttons)
@@ -102,28 +107,75 @@ async def search_pagination_callback(update: Update, context: ContextTypes.DEFAU
     query_data = update.callback_query
     await query_data.answer()
     
-    data_parts = query_data.data.split("_")
-    direction = data_parts[1]  # prev or next
-    current_page = int(data_parts[2])
-    query = data_parts[3]
-    room_code = data_parts[4]
+    # callback_data is "search_<prev|next>_<page>_<session token>"
+    _, direction, current_page, token = query_data.data.split("_", 3)
+    current_page = int(current_page)
     
     new_page = current_page - 1 if direction == "prev" else current_page + 1
     
-    # Get results for new page
-    files = await SearchService.search_files(
-        room_code, 
-        query, 
-        skip=new_page * RESULTS_PER_PAGE, 
-        limit=RESULTS_PER_PAGE
+    # Slice the stored result ids instead of re-running the search
+    session_page = await SearchService.get_session_page(token, new_page, limit=RESULTS_PER_PAGE)
+    if not session_page:
+        await query_data.edit_message_text("⌛ These search results have expired. Please run /search again.")
+        return
+    
+    query, room_code, files, total, capped = session_page
+    await _display_search_results(update, room_code, files, query, token, new_page, total, capped)
+
+
+async def similar_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /similar command (must reply to a file)"""
+    user = update.effective_user
+    message = update.message
+    replied_msg = message.reply_to_message
+    
+    file_id = None
+    file_unique_id = None
+    if replied_msg and replied_msg.document:
+        file_id = replied_msg.document.file_id
+        file_unique_id = replied_msg.document.file_unique_id
+    elif replied_msg and replied_msg.photo:
+        file_id = replied_msg.photo[-1].file_id
+        file_unique_id = replied_msg.photo[-1].file_unique_id
+    
+    if not file_id:
+        await message.reply_text("❌ Please reply to a file with /similar to find related files.")
+        return
+    
+    # Get room
+    room_code = await RoomResolver.resolve(update.effective_chat, user.id)
+    
+    if not room_code:
+        await message.reply_text(
+            "❌ You need to be in a room to find similar files.\n"
+            "Use /create_room or /join_room"
+        )
+        return
+    
+    results = await SearchService.similar_files(
+        room_code, file_id, limit=RESULTS_PER_PAGE, file_unique_id=file_unique_id
     )
-    total = await SearchService.count_search_results(room_code, query)
     
-    await _display_search_results(update, files, query, room_code, new_page, total)
+    if results is None:
+        await message.reply_text("❌ That file isn't in this room.")
+        return
+    
+    if not results:
+        await message.reply_text("🔍 No similar files found.")
+        return
+    
+    result_text = "🔗 **Similar files:**\n\n"
+    for idx, (file, score) in enumerate(results, start=1):
+        tags_display = ", ".join(file.tags + file.ai_tags) if (file.tags or file.ai_tags) else "No tags"
+        result_text += f"{idx}. 📎 **{file.file_name or 'Unnamed'}** ({score:.0%} match)\n"
+        result_text += f"   🏷️ {tags_display}\n\n"
+    
+    await message.reply_text(result_text, parse_mode="Markdown")
 
 
 # Handler registration
 search_handlers = [
     CommandHandler("search", search_command),
+    CommandHandler("similar", similar_command),
     CallbackQueryHandler(search_pagination_callback, pattern="^search_(prev|next)_"),
 ]
\ No newline at end of file
@@ -57,6 +57,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 • Send any file to upload \\(PDF, image, doc\\)
 • `/add_tags <tags>` \\- Reply to a file to add tags
 • `/search <query>` \\- Search files in current room
+• `/similar` \\- Reply to a file to find related files
+• `/tags [prefix]` \\- Show the room's most used tags
 
 *AI Features:*
 • `/summarise` or `/summarize` \\- Reply to content to get summary
@@ -1,3 +1,7 @@
-from .models import User, Room, File, AIUsage, Settings
+from .models import User, Room, Membership, File, AIUsage, Settings
+from .records import FileRecord, RoomRecord, UserRecord
 
-__all__ = ["User", "Room", "File", "AIUsage", "Settings"]
\ No newline at end of file
+__all__ = [
+    "User", "Room", "Membership", "File", "AIUsage", "Settings",
+    "FileRecord", "RoomRecord", "UserRecord",
+]
\ No newline at end of file
@@ -18,12 +18,18 @@ class Room(BaseModel):
     name: str
     description: Optional[str] = None
     owner_id: int
-    members: List[int] = []
+    member_count: int = 0  # Maintained alongside the memberships collection
     linked_chat_id: Optional[int] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
     is_active: bool = True
 
 
+class Membership(BaseModel):
+    room_code: str
+    user_id: int
+    joined_at: datetime = Field(default_factory=datetime.utcnow)
+
+
 class File(BaseModel):
     file_id: str
     file_type: str  # document, photo, text, voice, etc.
@@ -35,6 +41,7 @@ class File(BaseModel):
     ai_tags: List[str] = []  # AI-suggested tags
     created_at: datetime = Field(default_factory=datetime.utcnow)
     message_id: Optional[int] = None  # For reference
+    file_unique_id: Optional[str] = None  # Telegram's stable id, keys the extracted text cache
 
 
 class AIUsage(BaseModel):
@@ -0,0 +1,54 @@
+from datetime import datetime
+from typing import List, Optional
+
+
+class FileRecord:
+    """
+    Read-only view of a file for listings (search results, admin tables).
+    Built straight from a trusted MongoDB document fetched with PROJECTION,
+    skipping pydantic validation; use File when a full, validated model is needed.
+    """
+    __slots__ = ("file_id", "file_type", "file_name", "caption", "uploader_id",
+                 "room_code", "tags", "ai_tags", "created_at")
+    PROJECTION = {field: 1 for field in __slots__}
+
+    def __init__(self, doc: dict):
+        self.file_id: str = doc.get("file_id")
+        self.file_type: str = doc.get("file_type")
+        self.file_name: Optional[str] = doc.get("file_name")
+        self.caption: Optional[str] = doc.get("caption")
+        self.uploader_id: int = doc.get("uploader_id")
+        self.room_code: str = doc.get("room_code")
+        self.tags: List[str] = doc.get("tags") or []
+        self.ai_tags: List[str] = doc.get("ai_tags") or []
+        self.created_at: datetime = doc.get("created_at")
+
+
+class RoomRecord:
+    """Read-only view of a room for listings, built from a document fetched with PROJECTION"""
+    __slots__ = ("code", "name", "owner_id", "member_count", "linked_chat_id", "created_at")
+    PROJECTION = {field: 1 for field in __slots__}
+
+    def __init__(self, doc: dict):
+        self.code: str = doc.get("code")
+        self.name: str = doc.get("name")
+        self.owner_id: int = doc.get("owner_id")
+        self.member_count: int = doc.get("member_count") or 0
+        self.linked_chat_id: Optional[int] = doc.get("linked_chat_id")
+        self.created_at: datetime = doc.get("created_at")
+
+
+class UserRecord:
+    """Read-only view of a user for listings, built from a document fetched with PROJECTION"""
+    __slots__ = ("user_id", "username", "first_name", "last_name", "role",
+                 "current_room_code", "created_at")
+    PROJECTION = {field: 1 for field in __slots__}
+
+    def __init__(self, doc: dict):
+        self.user_id: int = doc.get("user_id")
+        self.username: Optional[str] = doc.get("username")
+        self.first_name: Optional[str] = doc.get("first_name")
+        self.last_name: Optional[str] = doc.get("last_name")
+        self.role: str = doc.get("role") or "user"
+        self.current_room_code: Optional[str] = doc.get("current_room_code")
+        self.created_at: datetime = doc.get("created_at")
\ No newline at end of file
@@ -1,7 +1,44 @@
 from .user_service import UserService
 from .room_service import RoomService
+from .room_resolver import RoomResolver
+from .room_replica import RoomReplica
 from .file_service import FileService
 from .search_service import SearchService
-from .ai_service import AIService
+from .tag_service import TagService
+from .search_cache import SearchCache
+from .trigram_index import TrigramIndex
+from .similarity_index import SimilarityIndex
+from .ai_service import AIService, AIServiceError
+from .ai_cache import AICache
+from .ai_limiter import AILimiter, AIBusyError
+from .ai_quota import AIQuota, Reservation
+from .extraction_service import ExtractionService
+from .text_cache import TextCache
+from .download_service import DownloadService, SpooledDownload, FileTooLargeError
+from .tag_batcher import TagBatcher
 
-__all__ = ["UserService", "RoomService", "FileService", "SearchService", "AIService"]
\ No newline at end of file
+__all__ = [
+    "UserService",
+    "RoomService",
+    "RoomResolver",
+    "RoomReplica",
+    "FileService",
+    "SearchService",
+    "TagService",
+    "SearchCache",
+    "TrigramIndex",
+    "SimilarityIndex",
+    "AIService",
+    "AIServiceError",
+    "AICache",
+    "AILimiter",
+    "AIBusyError",
+    "AIQuota",
+    "Reservation",
+    "ExtractionService",
+    "TextCache",
+    "DownloadService",
+    "SpooledDownload",
+    "FileTooLargeError",
+    "TagBatcher"
+]
\ No newline at end of file
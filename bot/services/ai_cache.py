@@ -0,0 +1,92 @@
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+from config import settings
+from db.mongo import get_database
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AICache:
+    """
+    Content-addressed cache of AI results.
+    A bounded in-process LRU sits in front of the ai_cache collection (TTL-indexed).
+    """
+    _memory: "OrderedDict[str, str]" = OrderedDict()
+    memory_hits: int = 0
+    db_hits: int = 0
+    misses: int = 0
+
+    @staticmethod
+    def make_key(command: str, model: str, temperature: float, max_tokens: int, text: str) -> str:
+        """Build cache key from request parameters and a hash of the input text"""
+        text_hash = hashlib.sha256(text.encode("utf-8", errors="ignore")).hexdigest()
+        return f"{command}:{model}:{temperature}:{max_tokens}:{text_hash}"
+
+    @classmethod
+    def _remember(cls, key: str, value: str):
+        """Put value in the in-memory LRU, evicting the oldest entry if full"""
+        cls._memory[key] = value
+        cls._memory.move_to_end(key)
+        while len(cls._memory) > settings.AI_CACHE_MEMORY_SIZE:
+            cls._memory.popitem(last=False)
+
+    @classmethod
+    async def get(cls, key: str) -> Optional[str]:
+        """Look up a cached result (memory first, then MongoDB)"""
+        if not settings.AI_CACHE_ENABLED:
+            return None
+
+        if key in cls._memory:
+            cls._memory.move_to_end(key)
+            cls.memory_hits += 1
+            return cls._memory[key]
+
+        try:
+            db = get_database()
+            entry = await db.ai_cache.find_one({"key": key}, {"result": 1})
+        except Exception as e:
+            logger.warning(f"AI cache lookup failed: {e}")
+            entry = None
+
+        if entry:
+            cls.db_hits += 1
+            cls._remember(key, entry["result"])
+            return entry["result"]
+
+        cls.misses += 1
+        return None
+
+    @classmethod
+    async def set(cls, key: str, command: str, result: str):
+        """Store a result in both cache levels"""
+        if not settings.AI_CACHE_ENABLED:
+            return
+
+        cls._remember(key, result)
+
+        try:
+            db = get_database()
+            await db.ai_cache.update_one(
+                {"key": key},
+                {"$set": {"command": command, "result": result, "created_at": datetime.utcnow()}},
+                upsert=True
+            )
+        except Exception as e:
+            logger.warning(f"AI cache write failed: {e}")
+
+    @classmethod
+    def stats(cls) -> dict:
+        """Hit/miss counters for the admin dashboard"""
+        hits = cls.memory_hits + cls.db_hits
+        lookups = hits + cls.misses
+        return {
+            "hits": hits,
+            "memory_hits": cls.memory_hits,
+            "db_hits": cls.db_hits,
+            "misses": cls.misses,
+            "hit_rate": round(hits / lookups * 100, 1) if lookups else 0.0,
+            "memory_entries": len(cls._memory),
+        }
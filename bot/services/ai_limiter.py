@@ -0,0 +1,171 @@
+from config import settings
+from typing import Optional
+import asyncio
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Minimum seconds between two multiplicative decreases (one burst of errors = one decrease)
+DECREASE_COOLDOWN = 5.0
+
+
+class AIBusyError(Exception):
+    """Raised when an outbound AI request cannot be admitted in time"""
+
+
+class AILimiter:
+    """
+    Global outbound limiter for LLM provider calls.
+    Combines a token bucket (request rate) with an adaptive concurrency limit
+    (additive increase / multiplicative decrease on 429/5xx and slow responses)
+    and pauses all calls while a provider Retry-After is in effect.
+    """
+    limit: Optional[float] = None
+    in_flight: int = 0
+    waiting: int = 0
+    rejected: int = 0
+    throttled: int = 0
+    completed: int = 0
+    _tokens: Optional[float] = None
+    _last_refill: float = 0.0
+    _blocked_until: float = 0.0
+    _last_decrease: float = 0.0
+    _condition: Optional[asyncio.Condition] = None
+
+    @classmethod
+    def _init_state(cls):
+        """Lazily initialise state from settings"""
+        if cls.limit is None:
+            cls.limit = float(settings.AI_CONCURRENCY_INITIAL)
+        if cls._tokens is None:
+            cls._tokens = float(settings.AI_RATE_BURST)
+            cls._last_refill = time.monotonic()
+        if cls._condition is None:
+            cls._condition = asyncio.Condition()
+
+    @classmethod
+    def _refill(cls, now: float):
+        """Add tokens accrued since the last refill"""
+        elapsed = now - cls._last_refill
+        cls._last_refill = now
+        cls._tokens = min(
+            float(settings.AI_RATE_BURST),
+            cls._tokens + elapsed * settings.AI_RATE_LIMIT_PER_SECOND
+        )
+
+    @classmethod
+    def _admission_delay(cls) -> Optional[float]:
+        """
+        Seconds until a request could be admitted: 0 to go now,
+        None to wait for a running request to finish
+        """
+        now = time.monotonic()
+        if now < cls._blocked_until:
+            return cls._blocked_until - now
+        if cls.in_flight >= int(cls.limit):
+            return None
+        cls._refill(now)
+        if cls._tokens < 1:
+            return (1 - cls._tokens) / settings.AI_RATE_LIMIT_PER_SECOND
+        return 0.0
+
+    @classmethod
+    async def acquire(cls):
+        """Wait for an outbound slot, or raise AIBusyError if the queue is full or times out"""
+        cls._init_state()
+
+        if cls.waiting >= settings.AI_MAX_QUEUE:
+            cls.rejected += 1
+            raise AIBusyError("AI service is busy, please try again shortly.")
+
+        deadline = time.monotonic() + settings.AI_QUEUE_TIMEOUT
+        if cls._blocked_until > deadline:
+            # The provider pause outlasts the queue timeout; don't make the caller wait for nothing
+            cls.rejected += 1
+            raise AIBusyError("AI service is busy, please try again shortly.")
+
+        cls.waiting += 1
+        try:
+            async with cls._condition:
+                while True:
+                    delay = cls._admission_delay()
+                    if delay == 0:
+                        cls._tokens -= 1
+                        cls.in_flight += 1
+                        return
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        cls.rejected += 1
+                        raise AIBusyError("AI service is busy, please try again shortly.")
+
+                    timeout = remaining if delay is None else min(delay, remaining)
+                    try:
+                        await asyncio.wait_for(cls._condition.wait(), timeout=timeout)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            cls.waiting -= 1
+
+    @classmethod
+    async def release(cls, latency: float, status_code: Optional[int] = None,
+                      retry_after: Optional[float] = None, failed: bool = False):
+        """Return a slot and adapt the concurrency limit to the call outcome"""
+        cls.in_flight -= 1
+        cls.completed += 1
+
+        overloaded = failed or (status_code is not None and (status_code == 429 or status_code >= 500))
+        if overloaded:
+            cls.throttled += 1
+
+        if overloaded or latency > settings.AI_LATENCY_TARGET:
+            cls._decrease()
+        elif status_code is not None and status_code < 400:
+            # Additive increase: roughly +1 per limit's worth of successful calls
+            cls.limit = min(float(settings.AI_CONCURRENCY_MAX), cls.limit + 1 / cls.limit)
+
+        if retry_after:
+            pause = min(retry_after, cls.max_pause())
+            cls._blocked_until = max(cls._blocked_until, time.monotonic() + pause)
+            logger.warning(f"AI provider asked to retry after {retry_after:.1f}s, pausing outbound calls for {pause:.1f}s")
+
+        async with cls._condition:
+            cls._condition.notify_all()
+
+    @classmethod
+    def _decrease(cls):
+        """Multiplicative decrease, at most once per cooldown window"""
+        now = time.monotonic()
+        if now - cls._last_decrease < DECREASE_COOLDOWN:
+            return
+        cls._last_decrease = now
+        cls.limit = max(float(settings.AI_CONCURRENCY_MIN), cls.limit / 2)
+        logger.info(f"AI concurrency limit decreased to {cls.limit:.1f}")
+
+    @staticmethod
+    def max_pause() -> float:
+        """
+        Longest Retry-After pause honoured: at most AI_RETRY_AFTER_MAX, and never past
+        AI_QUEUE_TIMEOUT, or acquire() would reject every call (retries included) meanwhile
+        """
+        return min(settings.AI_RETRY_AFTER_MAX, settings.AI_QUEUE_TIMEOUT)
+
+    @staticmethod
+    def is_retryable(status_code: int) -> bool:
+        """Whether a provider status code indicates a transient overload"""
+        return status_code == 429 or status_code >= 500
+
+    @classmethod
+    def stats(cls) -> dict:
+        """Limiter state for the admin settings page"""
+        cls._init_state()
+        return {
+            "concurrency_limit": int(cls.limit),
+            "in_flight": cls.in_flight,
+            "queue_depth": cls.waiting,
+            "rejected": cls.rejected,
+            "throttled": cls.throttled,
+            "completed": cls.completed,
+            "paused_for": round(max(0.0, cls._blocked_until - time.monotonic()), 1),
+        }
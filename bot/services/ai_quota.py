@@ -0,0 +1,206 @@
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from config import settings
+from db.mongo import get_database
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Reservation:
+    """
+    One AI call reserved against a user's daily quota.
+    commit() keeps it; refund() (a no-op once committed) hands it back.
+    """
+
+    def __init__(self, user_id: int, date: str):
+        self.user_id = user_id
+        self.date = date
+        self.settled = False
+
+    def commit(self):
+        """Keep the reserved call (the AI answer was produced)"""
+        if not self.settled:
+            self.settled = True
+            AIQuota.committed += 1
+
+    async def refund(self):
+        """Return the reserved call to the quota, unless already committed or refunded"""
+        if not self.settled:
+            self.settled = True
+            await AIQuota._refund(self)
+
+
+class AIQuota:
+    """
+    Per-user daily AI call quota stored in ai_usage (one document per user and day).
+    reserve() takes a call in a single conditional find_one_and_update that increments
+    only while the count is below AI_CALLS_PER_USER_PER_DAY, so concurrent requests
+    cannot overshoot the limit. Reservations that don't end in an AI answer are refunded.
+    With AI_QUOTA_SHARD_ENABLED, counts are kept in process and synced to MongoDB in
+    batches every AI_QUOTA_SYNC_INTERVAL seconds; each process then enforces the limit
+    on the last synced total plus its own unsynced calls.
+    """
+    _known: Dict[Tuple[int, str], int] = {}
+    _pending: Dict[Tuple[int, str], int] = {}
+    _task: Optional["asyncio.Task"] = None
+    reserved: int = 0
+    committed: int = 0
+    refunded: int = 0
+    rejected: int = 0
+    syncs: int = 0
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.utcnow().strftime("%Y-%m-%d")
+
+    @classmethod
+    async def reserve(cls, user_id: int, command: str) -> Optional[Reservation]:
+        """Reserve one AI call for a user today, or return None if the daily limit is reached"""
+        date = cls._today()
+        if settings.AI_QUOTA_SHARD_ENABLED:
+            reserved = await cls._reserve_local(user_id, date)
+        else:
+            reserved = await cls._reserve_db(user_id, date, command)
+
+        if not reserved:
+            cls.rejected += 1
+            return None
+        cls.reserved += 1
+        return Reservation(user_id, date)
+
+    @staticmethod
+    async def _reserve_db(user_id: int, date: str, command: str) -> bool:
+        """Atomically increment today's count if it is below the limit"""
+        db = get_database()
+        # A second attempt covers two first-of-day upserts racing on the unique index
+        for _ in range(2):
+            try:
+                usage = await db.ai_usage.find_one_and_update(
+                    {"user_id": user_id, "date": date, "count": {"$lt": settings.AI_CALLS_PER_USER_PER_DAY}},
+                    {
+                        "$inc": {"count": 1},
+                        "$set": {"command": command, "created_at": datetime.utcnow()}
+                    },
+                    projection={"count": 1},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+                return usage is not None
+            except DuplicateKeyError:
+                # Today's document exists but is at the limit (or was just inserted)
+                continue
+        return False
+
+    @classmethod
+    async def _reserve_local(cls, user_id: int, date: str) -> bool:
+        """Reserve against the in-process shard, loading the user's count on first use"""
+        key = (user_id, date)
+        if key not in cls._known:
+            db = get_database()
+            usage = await db.ai_usage.find_one({"user_id": user_id, "date": date}, {"count": 1})
+            cls._known[key] = usage.get("count", 0) if usage else 0
+
+        if cls._known[key] + cls._pending.get(key, 0) >= settings.AI_CALLS_PER_USER_PER_DAY:
+            return False
+        cls._pending[key] = cls._pending.get(key, 0) + 1
+        cls._ensure_sync()
+        return True
+
+    @classmethod
+    async def _refund(cls, reservation: Reservation):
+        cls.refunded += 1
+        key = (reservation.user_id, reservation.date)
+        if settings.AI_QUOTA_SHARD_ENABLED:
+            cls._pending[key] = cls._pending.get(key, 0) - 1
+            return
+
+        db = get_database()
+        try:
+            await db.ai_usage.update_one(
+                {"user_id": reservation.user_id, "date": reservation.date, "count": {"$gt": 0}},
+                {"$inc": {"count": -1}}
+            )
+        except PyMongoError as e:
+            logger.warning(f"Failed to refund AI call for user {reservation.user_id}: {e}")
+
+    @classmethod
+    def _ensure_sync(cls):
+        """Start the background sync loop on first use"""
+        if cls._task is None or cls._task.done():
+            cls._task = asyncio.create_task(cls._sync_loop())
+
+    @classmethod
+    async def _sync_loop(cls):
+        while True:
+            await asyncio.sleep(settings.AI_QUOTA_SYNC_INTERVAL)
+            await cls.sync()
+
+    @classmethod
+    async def sync(cls):
+        """Write unsynced shard counts to MongoDB in one bulk write and refresh known totals"""
+        pending, cls._pending = {key: delta for key, delta in cls._pending.items() if delta}, {}
+        today = cls._today()
+        # Days that have ended no longer need a cached total
+        cls._known = {key: count for key, count in cls._known.items() if key[1] == today}
+        if not pending:
+            return
+        # Keep the in-flight calls counted so reservations made during the write still see them
+        for key, delta in pending.items():
+            if key in cls._known:
+                cls._known[key] += delta
+
+        db = get_database()
+        now = datetime.utcnow()
+        try:
+            await db.ai_usage.bulk_write([
+                UpdateOne(
+                    {"user_id": user_id, "date": date},
+                    {"$inc": {"count": delta}, "$set": {"created_at": now}},
+                    upsert=True
+                )
+                for (user_id, date), delta in pending.items()
+            ], ordered=False)
+        except PyMongoError as e:
+            logger.warning(f"AI quota sync failed, will retry: {e}")
+            for key, delta in pending.items():
+                if key in cls._known:
+                    cls._known[key] -= delta
+                cls._pending[key] = cls._pending.get(key, 0) + delta
+            return
+        cls.syncs += 1
+
+        # Pick up calls made by other processes since the last sync
+        user_ids = [user_id for user_id, date in pending if date == today]
+        cursor = db.ai_usage.find({"user_id": {"$in": user_ids}, "date": today}, {"user_id": 1, "count": 1})
+        async for usage in cursor:
+            cls._known[(usage["user_id"], today)] = usage.get("count", 0)
+
+    @classmethod
+    async def shutdown(cls):
+        """Stop the sync loop and flush unsynced counts"""
+        if cls._task is not None:
+            cls._task.cancel()
+            try:
+                await cls._task
+            except asyncio.CancelledError:
+                pass
+            cls._task = None
+        if cls._pending:
+            await cls.sync()
+
+    @classmethod
+    def stats(cls) -> dict:
+        """Quota counters for the admin settings page"""
+        return {
+            "mode": "sharded" if settings.AI_QUOTA_SHARD_ENABLED else "atomic",
+            "reserved": cls.reserved,
+            "committed": cls.committed,
+            "refunded": cls.refunded,
+            "rejected": cls.rejected,
+            "unsynced": sum(cls._pending.values()),
+            "syncs": cls.syncs,
+        }
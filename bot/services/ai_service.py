@@ -1,57 +1,419 @@
+import asyncio
+import json
+import re
+import time
 import httpx
 from config import settings
-from typing import List, Optional
-from datetime import datetime
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
 from db.mongo import get_database
+from bot.services.ai_cache import AICache
+from bot.services.ai_limiter import AILimiter
+from email.utils import parsedate_to_datetime
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Maximum characters of input text sent to the LLM
+MAX_INPUT_CHARS = 8000
+MAX_TAG_INPUT_CHARS = 4000
+# Per-item input cap when tagging several uploads in one prompt
+MAX_TAG_BATCH_ITEM_CHARS = 500
+
+# Rough characters-per-token ratio used to size map-reduce chunks
+CHARS_PER_TOKEN = 4
+# Maximum map passes before the reduced notes are truncated
+MAX_REDUCE_DEPTH = 2
+NOTES_INTRO = "The following are notes taken from consecutive sections of a long document. "
+
+
+# Callback receiving each streamed text delta
+ChunkCallback = Callable[[str], Awaitable[None]]
+
+
+class AIServiceError(Exception):
+    """Raised when the LLM provider call fails"""
+
 
 class AIService:
     """
     Abstracted AI client that can work with Perplexity API or compatible LLMs
     """
+    client: Optional[httpx.AsyncClient] = None
     
+    # Single-flight registry: cache key -> future of the in-flight LLM call
+    _inflight: Dict[str, "asyncio.Future"] = {}
+    coalesced_calls: int = 0
+
+    @classmethod
+    async def open_client(cls):
+        """Create the shared, pooled HTTP client used for all LLM calls"""
+        if cls.client is not None:
+            return
+        
+        http2 = settings.AI_HTTP2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("HTTP/2 requested but 'h2' is not installed, falling back to HTTP/1.1")
+                http2 = False
+        
+        cls.client = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=settings.AI_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.AI_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.AI_HTTP_KEEPALIVE_EXPIRY
+            ),
+            timeout=httpx.Timeout(
+                connect=settings.AI_CONNECT_TIMEOUT,
+                read=settings.AI_READ_TIMEOUT,
+                write=settings.AI_WRITE_TIMEOUT,
+                pool=settings.AI_POOL_TIMEOUT
+            ),
+            headers={
+                "Authorization": f"Bearer {settings.AI_API_KEY}",
+                "Content-Type": "application/json"
+            }
+        )
+        logger.info(f"AI HTTP client opened (http2={http2})")
+
+    @classmethod
+    async def close_client(cls):
+        """Close the shared HTTP client and release pooled connections"""
+        if cls.client is not None:
+            await cls.client.aclose()
+            cls.client = None
+            logger.info("AI HTTP client closed")
+
+    @classmethod
+    async def _get_client(cls) -> httpx.AsyncClient:
+        """Get the shared client, opening it lazily outside the app lifespan"""
+        if cls.client is None:
+            await cls.open_client()
+        return cls.client
+
+    @staticmethod
+    def _build_payload(messages: List[dict], max_tokens: Optional[int] = None,
+                       stream: bool = False) -> dict:
+        """Build chat completion request body"""
+        payload = {
+            "model": settings.AI_MODEL,
+            "messages": messages,
+            "max_tokens": max_tokens or settings.AI_MAX_TOKENS,
+            "temperature": settings.AI_TEMPERATURE
+        }
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    @staticmethod
+    def _parse_retry_after(response: httpx.Response) -> Optional[float]:
+        """Parse a Retry-After header (seconds or HTTP date) into seconds"""
+        value = response.headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+            return max(0.0, retry_at.timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    async def _post(client: httpx.AsyncClient, payload: dict) -> httpx.Response:
+        """POST through the outbound limiter, feeding the outcome back to it"""
+        await AILimiter.acquire()
+        started = time.monotonic()
+        response = None
+        try:
+            response = await client.post(settings.AI_API_URL, json=payload)
+            return response
+        finally:
+            status_code = response.status_code if response is not None else None
+            retry_after = None
+            if response is not None and AILimiter.is_retryable(status_code):
+                retry_after = AIService._parse_retry_after(response)
+            await AILimiter.release(
+                time.monotonic() - started,
+                status_code=status_code,
+                retry_after=retry_after,
+                failed=response is None
+            )
+
     @staticmethod
     async def _call_api(messages: List[dict], max_tokens: Optional[int] = None) -> str:
-        """Make API call to LLM service"""
+        """Make API call to LLM service, retrying provider overload responses"""
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                payload = {
-                    "model": settings.AI_MODEL,
-                    "messages": messages,
-                    "max_tokens": max_tokens or settings.AI_MAX_TOKENS,
-                    "temperature": settings.AI_TEMPERATURE
-                }
+            client = await AIService._get_client()
+            payload = AIService._build_payload(messages, max_tokens)
+            
+            for attempt in range(settings.AI_MAX_RETRIES + 1):
+                response = await AIService._post(client, payload)
                 
-                headers = {
-                    "Authorization": f"Bearer {settings.AI_API_KEY}",
-                    "Content-Type": "application/json"
-                }
+                if not AILimiter.is_retryable(response.status_code) or attempt == settings.AI_MAX_RETRIES:
+                    break
                 
-                response = await client.post(
-                    settings.AI_API_URL,
-                    json=payload,
-                    headers=headers
-                )
+                # Retry-After pauses the limiter itself; otherwise back off exponentially
+                retry_after = AIService._parse_retry_after(response)
+                if retry_after is None:
+                    await asyncio.sleep(2 ** attempt)
+                elif retry_after > AILimiter.max_pause():
+                    break
+                logger.warning(f"AI provider returned {response.status_code}, retrying ({attempt + 1})")
+            
+            response.raise_for_status()
+            data = response.json()
+            
+            # Extract response text (adjust based on API structure)
+            if "choices" in data and len(data["choices"]) > 0:
+                return data["choices"][0]["message"]["content"]
+            
+            raise AIServiceError("AI provider returned no choices.")
                 
+        except Exception as e:
+            logger.error(f"AI API call failed: {e}")
+            raise AIServiceError(f"Unable to process AI request. {str(e)}") from e
+
+    @staticmethod
+    async def _stream_api(messages: List[dict], max_tokens: Optional[int] = None) -> AsyncIterator[str]:
+        """Stream completion text deltas from an OpenAI-compatible SSE endpoint"""
+        client = await AIService._get_client()
+        payload = AIService._build_payload(messages, max_tokens, stream=True)
+        
+        # The limiter slot is held for the whole stream; latency is time to response headers
+        await AILimiter.acquire()
+        started = time.monotonic()
+        latency = None
+        status_code = None
+        retry_after = None
+        try:
+            async with client.stream("POST", settings.AI_API_URL, json=payload) as response:
+                latency = time.monotonic() - started
+                status_code = response.status_code
+                if AILimiter.is_retryable(status_code):
+                    retry_after = AIService._parse_retry_after(response)
                 response.raise_for_status()
-                data = response.json()
-                
-                # Extract response text (adjust based on API structure)
-                if "choices" in data and len(data["choices"]) > 0:
-                    return data["choices"][0]["message"]["content"]
-                
-                return "Unable to get AI response."
                 
+                async for content in AIService._iter_stream(response):
+                    yield content
+        finally:
+            await AILimiter.release(
+                latency if latency is not None else time.monotonic() - started,
+                status_code=status_code,
+                retry_after=retry_after,
+                failed=status_code is None
+            )
+
+    @staticmethod
+    async def _iter_stream(response: httpx.Response) -> AsyncIterator[str]:
+        """Yield text deltas from a streaming completion response"""
+        # Provider ignored stream=True and sent a regular JSON completion
+        if "text/event-stream" not in response.headers.get("content-type", ""):
+            await response.aread()
+            data = response.json()
+            if data.get("choices"):
+                yield data["choices"][0]["message"]["content"]
+            return
+        
+        async for line in response.aiter_lines():
+            line = line.strip()
+            if not line.startswith("data:"):
+                continue
+            
+            chunk = line[len("data:"):].strip()
+            if chunk == "[DONE]":
+                break
+            
+            try:
+                data = json.loads(chunk)
+            except ValueError:
+                continue
+            
+            choices = data.get("choices") or []
+            if not choices:
+                continue
+            content = (choices[0].get("delta") or {}).get("content")
+            if content:
+                yield content
+
+    @staticmethod
+    async def _streamed_call(messages: List[dict], max_tokens: Optional[int],
+                             on_chunk: ChunkCallback) -> str:
+        """
+        Stream a completion, passing each delta to on_chunk.
+        Falls back to a regular call if streaming fails before any text arrives.
+        """
+        parts = []
+        try:
+            async for delta in AIService._stream_api(messages, max_tokens):
+                parts.append(delta)
+                await on_chunk(delta)
         except Exception as e:
-            logger.error(f"AI API call failed: {e}")
-            return f"Error: Unable to process AI request. {str(e)}"
+            if parts:
+                logger.error(f"AI stream interrupted: {e}")
+                raise AIServiceError(f"AI response was interrupted. {str(e)}") from e
+            logger.warning(f"AI streaming failed, falling back to non-streaming call: {e}")
+            return await AIService._call_api(messages, max_tokens=max_tokens)
+        
+        if not parts:
+            return await AIService._call_api(messages, max_tokens=max_tokens)
+        return "".join(parts)
+
+    @staticmethod
+    async def _cached_call(command: str, messages: List[dict], text: str,
+                           max_tokens: Optional[int] = None,
+                           on_chunk: Optional[ChunkCallback] = None) -> Tuple[str, bool]:
+        """
+        Call the LLM through the result cache, coalescing concurrent identical requests.
+        If on_chunk is given and streaming is enabled, the caller that makes the LLM call
+        receives text deltas as they arrive.
+        Returns (result, cached) where cached is True if this caller triggered no LLM call.
+        """
+        tokens = max_tokens or settings.AI_MAX_TOKENS
+        key = AICache.make_key(command, settings.AI_MODEL, settings.AI_TEMPERATURE, tokens, text)
+        
+        # Join an identical request that is already in flight
+        inflight = AIService._inflight.get(key)
+        if inflight is not None:
+            AIService.coalesced_calls += 1
+            return await asyncio.shield(inflight), True
+        
+        future = asyncio.get_running_loop().create_future()
+        AIService._inflight[key] = future
+        try:
+            cached = await AICache.get(key)
+            if cached is not None:
+                future.set_result(cached)
+                return cached, True
+            
+            if on_chunk and settings.AI_STREAMING_ENABLED:
+                result = await AIService._streamed_call(messages, tokens, on_chunk)
+            else:
+                result = await AIService._call_api(messages, max_tokens=tokens)
+            await AICache.set(key, command, result)
+            future.set_result(result)
+            return result, False
+        except BaseException as e:
+            if not future.done():
+                if isinstance(e, asyncio.CancelledError):
+                    e = AIServiceError("AI request was cancelled.")
+                future.set_exception(e)
+                # Mark as retrieved so an unobserved failure isn't logged twice
+                future.exception()
+            raise
+        finally:
+            AIService._inflight.pop(key, None)
+
+    @staticmethod
+    def inflight_stats() -> dict:
+        """Single-flight counters for the admin dashboard"""
+        return {
+            "inflight": len(AIService._inflight),
+            "coalesced_calls": AIService.coalesced_calls,
+        }
+
+    @staticmethod
+    def _split_chunks(text: str, max_chars: int) -> List[str]:
+        """Split text on page/paragraph boundaries into chunks of at most max_chars"""
+        pieces = []
+        for block in re.split(r"\f|\n\s*\n", text):
+            block = block.strip()
+            # Hard-split paragraphs that alone exceed the budget, preferring word boundaries
+            while len(block) > max_chars:
+                cut = block.rfind(" ", 0, max_chars)
+                if cut <= 0:
+                    cut = max_chars
+                pieces.append(block[:cut])
+                block = block[cut:].lstrip()
+            if block:
+                pieces.append(block)
+        
+        chunks = []
+        current = []
+        size = 0
+        for piece in pieces:
+            if current and size + len(piece) > max_chars:
+                chunks.append("\n\n".join(current))
+                current, size = [], 0
+            current.append(piece)
+            size += len(piece) + 2
+        if current:
+            chunks.append("\n\n".join(current))
+        return chunks
+
+    @staticmethod
+    async def _map_chunks(text: str) -> Tuple[str, bool]:
+        """
+        Condense each chunk of a long text into notes, in parallel with bounded concurrency.
+        Chunk results are cached individually, so unchanged chunks are never re-processed.
+        Returns (notes, cached).
+        """
+        chunks = AIService._split_chunks(text, settings.AI_CHUNK_TOKENS * CHARS_PER_TOKEN)
+        if len(chunks) > settings.AI_MAX_CHUNKS:
+            logger.info(f"Input has {len(chunks)} chunks, processing the first {settings.AI_MAX_CHUNKS}")
+            chunks = chunks[:settings.AI_MAX_CHUNKS]
+        
+        semaphore = asyncio.Semaphore(settings.AI_CHUNK_CONCURRENCY)
+        
+        async def map_chunk(chunk: str) -> Tuple[str, bool]:
+            messages = [
+                {
+                    "role": "system",
+                    "content": "You are a helpful study assistant. Take concise, faithful notes of study materials."
+                },
+                {
+                    "role": "user",
+                    "content": f"Write concise notes of the key facts, definitions and arguments in this section of a longer document:\n\n{chunk}"
+                }
+            ]
+            async with semaphore:
+                return await AIService._cached_call(
+                    "chunk_notes", messages, chunk, max_tokens=settings.AI_CHUNK_SUMMARY_TOKENS
+                )
+        
+        results = await asyncio.gather(*(map_chunk(chunk) for chunk in chunks))
+        notes = "\n\n".join(f"[Part {idx}]\n{result}" for idx, (result, _) in enumerate(results, start=1))
+        return notes, all(cached for _, cached in results)
+
+    @staticmethod
+    def _uses_map_reduce(command: str) -> bool:
+        """Whether a command condenses long input instead of truncating it"""
+        return command in {c.strip() for c in settings.AI_MAP_REDUCE_COMMANDS.split(",")}
+
+    @staticmethod
+    def input_budget(command: str) -> int:
+        """Maximum characters of input a command will actually use"""
+        if AIService._uses_map_reduce(command):
+            return settings.AI_MAX_CHUNKS * settings.AI_CHUNK_TOKENS * CHARS_PER_TOKEN
+        return MAX_INPUT_CHARS
+
+    @staticmethod
+    async def _prepare_input(command: str, text: str) -> Tuple[str, str, bool]:
+        """
+        Fit text into the model input budget.
+        Commands listed in AI_MAP_REDUCE_COMMANDS condense long input chunk by chunk,
+        others truncate it. Returns (text, prompt intro, cached).
+        """
+        if not AIService._uses_map_reduce(command) or len(text) <= MAX_INPUT_CHARS:
+            return text[:MAX_INPUT_CHARS], "", True
+        
+        cached = True
+        for _ in range(MAX_REDUCE_DEPTH):
+            if len(text) <= MAX_INPUT_CHARS:
+                break
+            text, chunks_cached = await AIService._map_chunks(text)
+            cached = cached and chunks_cached
+        
+        return text[:MAX_INPUT_CHARS], NOTES_INTRO, cached
 
     @staticmethod
-    async def summarise(text: str) -> str:
-        """Generate summary of text"""
+    async def summarise(text: str, on_chunk: Optional[ChunkCallback] = None) -> Tuple[str, bool]:
+        """Generate summary of text. Returns (result, cached)"""
+        text, intro, input_cached = await AIService._prepare_input("summarise", text)
         messages = [
             {
                 "role": "system",
@@ -59,14 +421,16 @@ class AIService:
             },
             {
                 "role": "user",
-                "content": f"Please provide a comprehensive summary of the following content:\n\n{text[:8000]}"
+                "content": f"{intro}Please provide a comprehensive summary of the following content:\n\n{text}"
             }
         ]
-        return await AIService._call_api(messages)
+        result, cached = await AIService._cached_call("summarise", messages, text, on_chunk=on_chunk)
+        return result, cached and input_cached
 
     @staticmethod
-    async def explain(text: str) -> str:
-        """Explain text in simpler terms"""
+    async def explain(text: str, on_chunk: Optional[ChunkCallback] = None) -> Tuple[str, bool]:
+        """Explain text in simpler terms. Returns (result, cached)"""
+        text, intro, input_cached = await AIService._prepare_input("explain", text)
         messages = [
             {
                 "role": "system",
@@ -74,14 +438,17 @@ class AIService:
             },
             {
                 "role": "user",
-                "content": f"Please explain the following content in simple terms:\n\n{text[:8000]}"
+                "content": f"{intro}Please explain the following content in simple terms:\n\n{text}"
             }
         ]
-        return await AIService._call_api(messages)
+        result, cached = await AIService._cached_call("explain", messages, text, on_chunk=on_chunk)
+        return result, cached and input_cached
 
     @staticmethod
-    async def generate_mcqs(text: str, num_questions: int = 5) -> str:
-        """Generate multiple choice questions"""
+    async def generate_mcqs(text: str, num_questions: int = 5,
+                            on_chunk: Optional[ChunkCallback] = None) -> Tuple[str, bool]:
+        """Generate multiple choice questions. Returns (result, cached)"""
+        text, intro, input_cached = await AIService._prepare_input("quiz", text)
         messages = [
             {
                 "role": "system",
@@ -89,14 +456,18 @@ class AIService:
             },
             {
                 "role": "user",
-                "content": f"Generate {num_questions} multiple-choice questions (with 4 options each and indicate the correct answer) based on this content:\n\n{text[:8000]}"
+                "content": f"{intro}Generate {num_questions} multiple-choice questions (with 4 options each and indicate the correct answer) based on this content:\n\n{text}"
             }
         ]
-        return await AIService._call_api(messages, max_tokens=2000)
+        result, cached = await AIService._cached_call(
+            f"quiz:{num_questions}", messages, text, max_tokens=2000, on_chunk=on_chunk
+        )
+        return result, cached and input_cached
 
     @staticmethod
     async def suggest_tags(text: str) -> List[str]:
         """Suggest relevant tags for content"""
+        text = text[:MAX_TAG_INPUT_CHARS]
         messages = [
             {
                 "role": "system",
@@ -104,52 +475,59 @@ class AIService:
             },
             {
                 "role": "user",
-                "content": f"Suggest 3-5 relevant tags (single words or short phrases, comma-separated) for the following content:\n\n{text[:4000]}"
+                "content": f"Suggest 3-5 relevant tags (single words or short phrases, comma-separated) for the following content:\n\n{text}"
             }
         ]
-        response = await AIService._call_api(messages, max_tokens=100)
+        response, _ = await AIService._cached_call("tags", messages, text, max_tokens=100)
         
         # Parse comma-separated tags
-        tags = [tag.strip().lower() for tag in response.split(",")]
-        return [tag for tag in tags if tag and len(tag) < 30][:5]
+        return AIService._clean_tags(response.split(","))
 
     @staticmethod
-    async def check_rate_limit(user_id: int) -> bool:
-        """Check if user has exceeded daily AI usage limit"""
-        db = get_database()
-        today = datetime.utcnow().strftime("%Y-%m-%d")
-        
-        usage = await db.ai_usage.find_one({"user_id": user_id, "date": today})
-        
-        if not usage:
-            return True  # No usage today, allowed
-        
-        total_count = usage.get("count", 0)
-        return total_count < settings.AI_CALLS_PER_USER_PER_DAY
+    def _clean_tags(tags: list) -> List[str]:
+        """Normalise suggested tags: lowercase, non-empty, short, at most 5"""
+        tags = [str(tag).strip().lower() for tag in tags]
+        return [tag for tag in tags if tag and len(tag) < 30][:5]
 
     @staticmethod
-    async def increment_usage(user_id: int, command: str):
-        """Increment AI usage counter for user"""
-        db = get_database()
-        today = datetime.utcnow().strftime("%Y-%m-%d")
+    async def suggest_tags_batch(texts: List[str]) -> List[List[str]]:
+        """
+        Suggest tags for several pieces of content with one LLM call.
+        Returns one tag list per text, in order (an empty list where the reply was unusable).
+        """
+        texts = [text[:MAX_TAG_BATCH_ITEM_CHARS] for text in texts]
+        if len(texts) == 1:
+            return [await AIService.suggest_tags(texts[0])]
         
-        await db.ai_usage.update_one(
-            {"user_id": user_id, "date": today},
+        items = "\n".join(f"{idx}. {' '.join(text.split())}" for idx, text in enumerate(texts, start=1))
+        messages = [
             {
-                "$inc": {"count": 1},
-                "$set": {"command": command, "created_at": datetime.utcnow()}
+                "role": "system",
+                "content": "You are a helpful study assistant. Suggest relevant tags/keywords for study materials."
             },
-            upsert=True
+            {
+                "role": "user",
+                "content": (
+                    f"Suggest 3-5 relevant tags (single words or short phrases) for each of the "
+                    f"{len(texts)} numbered items below. Reply with only a JSON array containing "
+                    f"one array of tag strings per item, in the same order.\n\n{items}"
+                )
+            }
+        ]
+        response, _ = await AIService._cached_call(
+            "tags_batch", messages, items, max_tokens=50 + 40 * len(texts)
         )
-
-    @staticmethod
-    async def get_usage_count(user_id: int) -> int:
-        """Get today's usage count for user"""
-        db = get_database()
-        today = datetime.utcnow().strftime("%Y-%m-%d")
         
-        usage = await db.ai_usage.find_one({"user_id": user_id, "date": today})
-        return usage.get("count", 0) if usage else 0
+        try:
+            parsed = json.loads(response[response.index("["):response.rindex("]") + 1])
+        except ValueError:
+            logger.warning("Batched tag suggestion returned no JSON array")
+            return [[] for _ in texts]
+        
+        if not isinstance(parsed, list):
+            return [[] for _ in texts]
+        results = [AIService._clean_tags(tags) if isinstance(tags, list) else [] for tags in parsed]
+        return (results + [[] for _ in texts])[:len(texts)]
 
     @staticmethod
     async def get_total_ai_calls() -> int:
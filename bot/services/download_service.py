@@ -0,0 +1,135 @@
+from typing import BinaryIO, Optional, Tuple
+from config import settings
+import httpx
+import tempfile
+import os
+import io
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class FileTooLargeError(Exception):
+    """Raised when a document exceeds DOWNLOAD_MAX_MB"""
+
+
+class SpooledDownload:
+    """
+    Download buffer that stays in memory up to max_memory bytes and spills to disk above it.
+    Works like tempfile.SpooledTemporaryFile, except the spilled file is named so that
+    extraction worker processes can open and mmap it.
+    """
+
+    def __init__(self, max_memory: int):
+        self.max_memory = max_memory
+        self.size = 0
+        self.path: Optional[str] = None
+        self._buffer: Optional[io.BytesIO] = io.BytesIO()
+        self._file: Optional[BinaryIO] = None
+
+    def write(self, data: bytes) -> int:
+        """Append downloaded bytes, rolling over to disk past the memory threshold"""
+        if self._file is None and self.size + len(data) > self.max_memory:
+            self._rollover()
+        target = self._file if self._file is not None else self._buffer
+        target.write(data)
+        self.size += len(data)
+        return len(data)
+
+    def _rollover(self):
+        """Move buffered bytes into a named temporary file"""
+        self._file = tempfile.NamedTemporaryFile(prefix="collalearn_", suffix=".download", delete=False)
+        self.path = self._file.name
+        self._file.write(self._buffer.getbuffer())
+        self._buffer = None
+
+    @property
+    def in_memory(self) -> bool:
+        return self._file is None
+
+    def getvalue(self) -> bytes:
+        """Bytes of an in-memory download"""
+        return self._buffer.getvalue()
+
+    def read_head(self, limit: int) -> Tuple[bytes, bool]:
+        """Read up to limit bytes from the start. Returns (data, complete)"""
+        if self._file is not None:
+            self._file.flush()
+            with open(self.path, "rb") as f:
+                data = f.read(limit)
+        else:
+            data = self._buffer.getbuffer()[:limit].tobytes()
+        return data, self.size <= limit
+
+    def close(self):
+        """Release memory and delete the spilled file"""
+        if self._file is not None:
+            self._file.close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+            self._file = None
+        self._buffer = None
+
+    def __enter__(self) -> "SpooledDownload":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class DownloadService:
+    """
+    Bounded downloads of Telegram documents: size checked before download,
+    body streamed into a SpooledDownload so memory per request stays capped.
+    """
+    client: Optional[httpx.AsyncClient] = None
+
+    @classmethod
+    async def open_client(cls):
+        """Create the shared HTTP client used for file downloads"""
+        if cls.client is None:
+            cls.client = httpx.AsyncClient(
+                timeout=httpx.Timeout(settings.DOWNLOAD_TIMEOUT, connect=settings.AI_CONNECT_TIMEOUT)
+            )
+
+    @classmethod
+    async def close_client(cls):
+        """Close the download HTTP client"""
+        if cls.client is not None:
+            await cls.client.aclose()
+            cls.client = None
+
+    @staticmethod
+    def check_size(file_size: Optional[int]):
+        """Reject files above DOWNLOAD_MAX_MB before downloading them"""
+        max_bytes = settings.DOWNLOAD_MAX_MB * 1024 * 1024
+        if file_size and file_size > max_bytes:
+            raise FileTooLargeError(f"File is too large to process (max {settings.DOWNLOAD_MAX_MB} MB).")
+
+    @classmethod
+    async def download(cls, bot, document) -> SpooledDownload:
+        """Download a Telegram document into a SpooledDownload (caller must close it)"""
+        DownloadService.check_size(document.file_size)
+
+        file = await bot.get_file(document.file_id)
+        spool = SpooledDownload(settings.DOWNLOAD_SPOOL_MB * 1024 * 1024)
+        try:
+            if file.file_path and file.file_path.startswith(("http://", "https://")):
+                if cls.client is None:
+                    await cls.open_client()
+                async with cls.client.stream("GET", file.file_path) as response:
+                    response.raise_for_status()
+                    async for chunk in response.aiter_bytes():
+                        spool.write(chunk)
+                        # file_size may be missing or wrong, so enforce the cap while streaming
+                        DownloadService.check_size(spool.size)
+            else:
+                # Local Bot API server: file_path is a path on this machine
+                await file.download_to_memory(spool)
+        except BaseException:
+            spool.close()
+            raise
+
+        return spool
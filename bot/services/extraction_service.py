@@ -0,0 +1,164 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional, Tuple, Union
+from config import settings
+from bot.workers.extraction import extract_pdf_text, init_worker
+import multiprocessing
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ExtractionService:
+    """
+    Runs CPU-heavy document text extraction in a bounded process pool
+    so parsing never blocks the event loop.
+    """
+    _executor: Optional[ProcessPoolExecutor] = None
+    _semaphore: Optional[asyncio.Semaphore] = None
+    _jobs_since_recycle: int = 0
+    # Jobs still awaited per pool; worker processes of replaced pools that are still draining;
+    # replaced pools with a stuck (timed-out) worker to kill once drained
+    _active: Dict[ProcessPoolExecutor, int] = {}
+    _draining: Dict[ProcessPoolExecutor, list] = {}
+    _stuck: set = set()
+    in_flight: int = 0
+    waiting: int = 0
+    completed: int = 0
+    failed: int = 0
+    timeouts: int = 0
+    recycles: int = 0
+
+    @classmethod
+    def start(cls):
+        """Create the worker pool"""
+        if cls._executor is not None:
+            return
+        cls._executor = ProcessPoolExecutor(
+            max_workers=settings.EXTRACTION_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+            initargs=(settings.EXTRACTION_MEMORY_LIMIT_MB,)
+        )
+        cls._jobs_since_recycle = 0
+        logger.info(f"Extraction pool started with {settings.EXTRACTION_WORKERS} workers")
+
+    @classmethod
+    def shutdown(cls):
+        """Stop the worker pool"""
+        if cls._executor is not None:
+            cls._executor.shutdown(wait=False, cancel_futures=True)
+            cls._executor = None
+            logger.info("Extraction pool stopped")
+        # Stuck workers of replaced pools would otherwise block interpreter exit
+        for executor in cls._stuck:
+            for process in cls._draining.pop(executor, []):
+                if process.is_alive():
+                    process.terminate()
+        cls._stuck.clear()
+
+    @classmethod
+    def _recycle(cls, failed: Optional[ProcessPoolExecutor] = None):
+        """
+        Replace the pool with fresh workers. Jobs already running in the old pool finish there.
+        failed is the pool a timeout or crash came from: if it was already replaced, the
+        current pool is kept.
+        """
+        old = cls._executor
+        if failed is not None and failed is not old:
+            return
+        cls._executor = None
+        cls.recycles += 1
+        if old is not None:
+            if cls._active.get(old):
+                # shutdown() drops the pool's process handles; keep them to kill a stuck worker later
+                cls._draining[old] = list((getattr(old, "_processes", None) or {}).values())
+            old.shutdown(wait=False)
+        cls.start()
+
+    @classmethod
+    def _retire_stuck(cls, executor: ProcessPoolExecutor):
+        """
+        A timed-out job cannot be cancelled, so its pool is replaced and, once its other
+        jobs have finished, terminated to free the stuck worker
+        """
+        cls._recycle(failed=executor)
+        cls._stuck.add(executor)
+
+    @classmethod
+    def _job_done(cls, executor: ProcessPoolExecutor):
+        """Stop tracking a job; kill a replaced pool's workers once only stuck jobs remain in it"""
+        cls._active[executor] -= 1
+        if cls._active[executor] > 0:
+            return
+        del cls._active[executor]
+        processes = cls._draining.pop(executor, [])
+        if executor in cls._stuck:
+            cls._stuck.discard(executor)
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+
+    @classmethod
+    async def extract_pdf(cls, source: Union[bytes, str], max_chars: int) -> Optional[Tuple[str, bool]]:
+        """
+        Extract up to about max_chars of text from a PDF (bytes or file path) in the worker pool.
+        Returns (text, complete), or None on failure or timeout.
+        """
+        if cls._semaphore is None:
+            cls._semaphore = asyncio.Semaphore(settings.EXTRACTION_WORKERS)
+        if cls._executor is None:
+            cls.start()
+
+        cls.waiting += 1
+        async with cls._semaphore:
+            cls.waiting -= 1
+            cls.in_flight += 1
+            if cls._jobs_since_recycle >= settings.EXTRACTION_RECYCLE_AFTER:
+                cls._recycle()
+            cls._jobs_since_recycle += 1
+
+            executor = cls._executor
+            cls._active[executor] = cls._active.get(executor, 0) + 1
+            try:
+                loop = asyncio.get_running_loop()
+                future = loop.run_in_executor(
+                    executor, extract_pdf_text, source, max_chars, settings.EXTRACTION_MAX_PAGES
+                )
+                result = await asyncio.wait_for(future, timeout=settings.EXTRACTION_TIMEOUT)
+                cls.completed += 1
+                return result
+            except asyncio.TimeoutError:
+                cls.timeouts += 1
+                logger.error(f"PDF extraction timed out after {settings.EXTRACTION_TIMEOUT}s")
+                cls._retire_stuck(executor)
+                return None
+            except BrokenProcessPool as e:
+                # A worker died, e.g. by hitting the memory cap
+                cls.failed += 1
+                logger.error(f"PDF extraction worker crashed: {e}")
+                cls._recycle(failed=executor)
+                return None
+            except Exception as e:
+                cls.failed += 1
+                logger.error(f"PDF extraction failed: {e}")
+                return None
+            finally:
+                cls._job_done(executor)
+                cls.in_flight -= 1
+
+    @classmethod
+    def stats(cls) -> dict:
+        """Pool saturation counters for the admin settings page"""
+        workers = settings.EXTRACTION_WORKERS
+        return {
+            "workers": workers,
+            "in_flight": cls.in_flight,
+            "waiting": cls.waiting,
+            "saturation": round(cls.in_flight / workers * 100, 1) if workers else 0.0,
+            "completed": cls.completed,
+            "failed": cls.failed,
+            "timeouts": cls.timeouts,
+            "recycles": cls.recycles,
+        }
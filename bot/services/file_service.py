@@ -1,6 +1,14 @@
 from db.mongo import get_database
+from db.pagination import CREATED_AT_KEYSET, CREATED_AT_SORT, decode_cursor, keyset_filter, paginate
 from bot.models.models import File
-from typing import List, Optional
+from bot.models.records import FileRecord
+from bot.services.search_cache import SearchCache
+from bot.services.trigram_index import TrigramIndex, INDEXED_FIELDS
+from bot.services.similarity_index import SimilarityIndex
+from bot.services.tag_service import TagService
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+from typing import Dict, List, Optional, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
@@ -11,8 +19,14 @@ class FileService:
     async def save_file(file_id: str, file_type: str, room_code: str, uploader_id: int,
                        file_name: Optional[str] = None, caption: Optional[str] = None,
                        tags: List[str] = None, ai_tags: List[str] = None,
-                       message_id: Optional[int] = None) -> File:
-        """Save file metadata to database"""
+                       message_id: Optional[int] = None,
+                       file_unique_id: Optional[str] = None) -> Tuple[File, bool]:
+        """
+        Save file metadata to database in a single write.
+        Re-uploads of the same file (same file_unique_id) within a room are not duplicated.
+        Returns (file, created) where created is False for a re-upload (file is the existing
+        one, or this upload's metadata if a concurrent insert is not readable yet).
+        """
         db = get_database()
         
         file = File(
@@ -24,22 +38,110 @@ class FileService:
             room_code=room_code,
             tags=tags or [],
             ai_tags=ai_tags or [],
-            message_id=message_id
+            message_id=message_id,
+            file_unique_id=file_unique_id
         )
         
-        await db.files.insert_one(file.model_dump())
+        doc = file.model_dump()
+        if file_unique_id:
+            try:
+                result = await db.files.update_one(
+                    {"room_code": room_code, "file_unique_id": file_unique_id},
+                    {"$setOnInsert": doc},
+                    upsert=True
+                )
+                upserted_id = result.upserted_id
+            except DuplicateKeyError:
+                # A concurrent upload of the same file won the upsert
+                upserted_id = None
+            if upserted_id is None:
+                existing = await FileService.get_file_by_unique_id(room_code, file_unique_id)
+                logger.info(f"File {file_unique_id} already in room {room_code}")
+                # The concurrent writer's document may not be readable yet; it holds the
+                # same file, so this upload's metadata stands in for it
+                return existing or file, False
+            doc["_id"] = upserted_id
+        else:
+            # Only files with a file_unique_id are covered by the partial unique index
+            doc.pop("file_unique_id")
+            await db.files.insert_one(doc)
+        
+        SearchCache.invalidate(room_code)
+        TrigramIndex.add_file(room_code, doc)
+        SimilarityIndex.add_file(room_code, doc)
+        await TagService.increment(room_code, file.tags + file.ai_tags)
         logger.info(f"Saved file {file_id} to room {room_code}")
         
-        return file
+        return file, True
 
     @staticmethod
-    async def add_tags(file_id: str, tags: List[str]):
-        """Add tags to a file"""
+    async def add_tags(room_code: str, file_id: str, tags: List[str],
+                       file_unique_id: Optional[str] = None):
+        """Add tags to a file in a room (matched by file_unique_id or file_id)"""
         db = get_database()
-        await db.files.update_one(
-            {"file_id": file_id},
-            {"$addToSet": {"tags": {"$each": tags}}}
+        
+        query = {"room_code": room_code, "file_id": file_id}
+        if file_unique_id:
+            query = {"room_code": room_code, "$or": [{"file_unique_id": file_unique_id}, {"file_id": file_id}]}
+        
+        file_data = await db.files.find_one_and_update(
+            query,
+            {"$addToSet": {"tags": {"$each": tags}}},
+            projection=INDEXED_FIELDS
         )
+        if not file_data:
+            return
+        
+        # file_data is the document before the update; apply $addToSet to it for the indexes
+        new_tags = [tag for tag in dict.fromkeys(tags) if tag not in file_data.get("tags", [])]
+        file_data["tags"] = file_data.get("tags", []) + new_tags
+        SearchCache.invalidate(room_code)
+        TrigramIndex.add_file(room_code, file_data)
+        SimilarityIndex.add_tags(room_code, file_data["_id"], new_tags)
+        # Tags already present as AI tags were counted for this file before
+        await TagService.increment(room_code, [tag for tag in new_tags if tag not in file_data.get("ai_tags", [])])
+
+    @staticmethod
+    async def add_ai_tags_bulk(room_code: str, ai_tags: Dict[str, List[str]]):
+        """Add AI-suggested tags to several files in a room (keyed by file_unique_id) with one bulk write"""
+        ai_tags = {unique_id: tags for unique_id, tags in ai_tags.items() if tags}
+        if not ai_tags:
+            return
+        
+        db = get_database()
+        before = await db.files.find(
+            {"room_code": room_code, "file_unique_id": {"$in": list(ai_tags)}},
+            {"file_unique_id": 1, **INDEXED_FIELDS}
+        ).to_list(length=len(ai_tags))
+        await db.files.bulk_write([
+            UpdateOne(
+                {"room_code": room_code, "file_unique_id": unique_id},
+                {"$addToSet": {"ai_tags": {"$each": tags}}}
+            )
+            for unique_id, tags in ai_tags.items()
+        ], ordered=False)
+        
+        # Apply the same $addToSet to the pre-update documents for the in-memory indexes
+        SearchCache.invalidate(room_code)
+        gained = []
+        for file_data in before:
+            tags = list(dict.fromkeys(ai_tags[file_data["file_unique_id"]]))
+            existing = set(file_data.get("tags", [])) | set(file_data.get("ai_tags", []))
+            new_tags = [tag for tag in tags if tag not in existing]
+            file_data["ai_tags"] = file_data.get("ai_tags", []) + [
+                tag for tag in tags if tag not in file_data.get("ai_tags", [])
+            ]
+            TrigramIndex.add_file(room_code, file_data)
+            SimilarityIndex.add_tags(room_code, file_data["_id"], new_tags)
+            gained.append(new_tags)
+        await TagService.increment_many(room_code, gained)
+
+    @staticmethod
+    async def get_file_by_unique_id(room_code: str, file_unique_id: str) -> Optional[File]:
+        """Get file by Telegram file_unique_id in a room"""
+        db = get_database()
+        file_data = await db.files.find_one({"room_code": room_code, "file_unique_id": file_unique_id})
+        return File(**file_data) if file_data else None
 
     @staticmethod
     async def get_file_by_message_id(room_code: str, message_id: int) -> Optional[File]:
@@ -56,6 +158,20 @@ class FileService:
         files = await cursor.to_list(length=limit)
         return [File(**f) for f in files]
 
+    @staticmethod
+    async def get_files_by_room_page(room_code: str, cursor: Optional[str] = None,
+                                     limit: int = 50) -> Tuple[List[File], Optional[str]]:
+        """Get a page of files in a room (newest first) with keyset pagination"""
+        db = get_database()
+        query = {"room_code": room_code}
+        values = decode_cursor(cursor, CREATED_AT_KEYSET) if cursor else None
+        if values:
+            query.update(keyset_filter(CREATED_AT_KEYSET, values))
+        
+        cursor_ = db.files.find(query).sort(CREATED_AT_SORT).limit(limit + 1)
+        files, next_cursor = paginate(await cursor_.to_list(length=limit + 1), CREATED_AT_KEYSET, limit)
+        return [File(**f) for f in files], next_cursor
+
     @staticmethod
     async def count_files(room_code: Optional[str] = None) -> int:
         """Count files, optionally filtered by room"""
@@ -75,4 +191,16 @@ class FileService:
         db = get_database()
         cursor = db.files.find().skip(skip).limit(limit).sort("created_at", -1)
         files = await cursor.to_list(length=limit)
-        return [File(**f) for f in files]
\ No newline at end of file
+        return [File(**f) for f in files]
+
+    @staticmethod
+    async def get_all_files_page(cursor: Optional[str] = None,
+                                 limit: int = 50) -> Tuple[List[FileRecord], Optional[str]]:
+        """Get a page of all files (newest first) with keyset pagination, as listing records"""
+        db = get_database()
+        values = decode_cursor(cursor, CREATED_AT_KEYSET) if cursor else None
+        query = keyset_filter(CREATED_AT_KEYSET, values) if values else {}
+        
+        cursor_ = db.files.find(query, FileRecord.PROJECTION).sort(CREATED_AT_SORT).limit(limit + 1)
+        files, next_cursor = paginate(await cursor_.to_list(length=limit + 1), CREATED_AT_KEYSET, limit)
+        return [FileRecord(f) for f in files], next_cursor
\ No newline at end of file
@@ -0,0 +1,154 @@
+from typing import Dict, Optional
+from pymongo.errors import OperationFailure, PyMongoError
+from config import settings
+from db.mongo import get_database
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait before reopening a change stream after an error
+RECONNECT_DELAY = 5.0
+
+
+class RoomReplica:
+    """
+    Optional in-memory replica of active rooms (ROOM_REPLICA_ENABLED), indexed by code
+    and by linked_chat_id. It is bootstrapped from one scan of the rooms collection and
+    kept current by a MongoDB change stream, resuming from the last seen resume token
+    after errors, so every process sees room writes made by any process.
+    Requires MongoDB running as a replica set; otherwise lookups fall back to queries.
+    """
+    _by_code: Dict[str, dict] = {}
+    _by_chat: Dict[int, str] = {}
+    _code_by_id: Dict[object, str] = {}
+    _resume_token: Optional[dict] = None
+    _task: Optional["asyncio.Task"] = None
+    ready: bool = False
+    events: int = 0
+    bootstraps: int = 0
+    reconnects: int = 0
+
+    @classmethod
+    async def start(cls):
+        """Start following the rooms collection (no-op unless ROOM_REPLICA_ENABLED)"""
+        if not settings.ROOM_REPLICA_ENABLED or cls._task is not None:
+            return
+        cls._task = asyncio.create_task(cls._follow())
+
+    @classmethod
+    async def stop(cls):
+        """Stop the change stream"""
+        cls.ready = False
+        if cls._task is not None:
+            cls._task.cancel()
+            try:
+                await cls._task
+            except asyncio.CancelledError:
+                pass
+            cls._task = None
+
+    @classmethod
+    def _apply(cls, room: dict):
+        """Insert, update or drop a room document in the replica"""
+        cls._remove(room["_id"])
+        if not room.get("is_active", True):
+            return
+        cls._by_code[room["code"]] = room
+        cls._code_by_id[room["_id"]] = room["code"]
+        if room.get("linked_chat_id") is not None:
+            cls._by_chat[room["linked_chat_id"]] = room["code"]
+
+    @classmethod
+    def _remove(cls, room_id):
+        code = cls._code_by_id.pop(room_id, None)
+        room = cls._by_code.pop(code, None) if code else None
+        if room and cls._by_chat.get(room.get("linked_chat_id")) == code:
+            del cls._by_chat[room["linked_chat_id"]]
+
+    @classmethod
+    async def _bootstrap(cls):
+        """Load every active room with one scan"""
+        db = get_database()
+        cls._by_code, cls._by_chat, cls._code_by_id = {}, {}, {}
+        async for room in db.rooms.find({"is_active": True}):
+            cls._apply(room)
+        cls.bootstraps += 1
+        logger.info(f"Room replica loaded {len(cls._by_code)} rooms")
+
+    @classmethod
+    async def _follow(cls):
+        """Consume the rooms change stream, reconnecting and resuming on errors"""
+        db = get_database()
+        while True:
+            try:
+                # Open the stream before scanning, so writes made during the scan are replayed
+                async with db.rooms.watch(full_document="updateLookup", resume_after=cls._resume_token) as stream:
+                    if cls._resume_token is None:
+                        await cls._bootstrap()
+                    cls.ready = True
+                    async for change in stream:
+                        if not cls._handle(change):
+                            # The stream was invalidated; it cannot be resumed
+                            cls._resume_token = None
+                            break
+                        cls._resume_token = stream.resume_token
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                cls.ready = False
+                if e.code == 40573:
+                    # Change streams need a replica set; keep using queries
+                    logger.warning("Room replica disabled: MongoDB is not a replica set")
+                    return
+                # e.g. the resume token fell off the oplog: start over from a fresh scan
+                logger.warning(f"Room change stream failed, re-bootstrapping: {e}")
+                cls._resume_token = None
+            except PyMongoError as e:
+                cls.ready = False
+                logger.warning(f"Room change stream interrupted, resuming: {e}")
+            cls.reconnects += 1
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    @classmethod
+    def _handle(cls, change: dict) -> bool:
+        """Apply one change event. Returns False if the stream must be restarted from a new scan"""
+        cls.events += 1
+        operation = change["operationType"]
+        if operation in ("insert", "update", "replace"):
+            room = change.get("fullDocument")
+            if room is not None:
+                cls._apply(room)
+            else:
+                # Deleted before the lookup ran
+                cls._remove(change["documentKey"]["_id"])
+        elif operation == "delete":
+            cls._remove(change["documentKey"]["_id"])
+        elif operation in ("drop", "rename", "dropDatabase", "invalidate"):
+            cls.ready = False
+            return False
+        return True
+
+    @classmethod
+    def get(cls, code: str) -> Optional[dict]:
+        """Active room by code; only meaningful while ready"""
+        return cls._by_code.get(code)
+
+    @classmethod
+    def get_by_chat_id(cls, chat_id: int) -> Optional[dict]:
+        """Active room linked to a chat; only meaningful while ready"""
+        code = cls._by_chat.get(chat_id)
+        return cls._by_code.get(code) if code else None
+
+    @classmethod
+    def stats(cls) -> dict:
+        """Replica state for the admin settings page"""
+        return {
+            "enabled": settings.ROOM_REPLICA_ENABLED,
+            "ready": cls.ready,
+            "rooms": len(cls._by_code),
+            "linked_chats": len(cls._by_chat),
+            "events": cls.events,
+            "bootstraps": cls.bootstraps,
+            "reconnects": cls.reconnects,
+        }
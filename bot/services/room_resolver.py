@@ -0,0 +1,109 @@
+from collections import OrderedDict
+from typing import Optional, Tuple
+from config import settings
+from db.mongo import get_database
+from bot.services.room_replica import RoomReplica
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RoomResolver:
+    """
+    Resolves which room a message belongs to: the user's current room in private
+    chats, the linked room in groups. Results (including "no room") are kept in
+    bounded TTL caches; the service methods that change them invalidate entries
+    immediately, so the TTL only bounds staleness from other processes.
+    """
+    _users: "OrderedDict[int, Tuple[float, Optional[str]]]" = OrderedDict()
+    _chats: "OrderedDict[int, Tuple[float, Optional[str]]]" = OrderedDict()
+    hits: int = 0
+    misses: int = 0
+
+    @classmethod
+    def _get(cls, cache: OrderedDict, key: int) -> Tuple[bool, Optional[str]]:
+        """Look up a cached room code. Returns (found, room_code)"""
+        entry = cache.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del cache[key]
+            cls.misses += 1
+            return False, None
+        cache.move_to_end(key)
+        cls.hits += 1
+        return True, entry[1]
+
+    @staticmethod
+    def _put(cache: OrderedDict, key: int, room_code: Optional[str]):
+        cache[key] = (time.monotonic() + settings.ROOM_CACHE_TTL_SECONDS, room_code)
+        cache.move_to_end(key)
+        while len(cache) > settings.ROOM_CACHE_SIZE:
+            cache.popitem(last=False)
+
+    @classmethod
+    async def get_user_room(cls, user_id: int) -> Optional[str]:
+        """Current room code of a user"""
+        found, room_code = cls._get(cls._users, user_id)
+        if found:
+            return room_code
+        
+        db = get_database()
+        user_data = await db.users.find_one({"user_id": user_id}, {"current_room_code": 1})
+        room_code = user_data.get("current_room_code") if user_data else None
+        cls._put(cls._users, user_id, room_code)
+        return room_code
+
+    @classmethod
+    async def get_chat_room(cls, chat_id: int) -> Optional[str]:
+        """Code of the active room linked to a group chat"""
+        if RoomReplica.ready:
+            room_data = RoomReplica.get_by_chat_id(chat_id)
+            return room_data["code"] if room_data else None
+        
+        found, room_code = cls._get(cls._chats, chat_id)
+        if found:
+            return room_code
+        
+        db = get_database()
+        room_data = await db.rooms.find_one({"linked_chat_id": chat_id, "is_active": True}, {"code": 1})
+        room_code = room_data["code"] if room_data else None
+        cls._put(cls._chats, chat_id, room_code)
+        return room_code
+
+    @classmethod
+    async def resolve(cls, chat, user_id: int) -> Optional[str]:
+        """Determine which room a message in chat from user_id belongs to"""
+        # If private chat, use user's current room
+        if chat.type == "private":
+            return await cls.get_user_room(user_id)
+        
+        # If group chat, find linked room
+        return await cls.get_chat_room(chat.id)
+
+    @classmethod
+    def invalidate_user(cls, user_id: int):
+        cls._users.pop(user_id, None)
+
+    @classmethod
+    def invalidate_chat(cls, chat_id: int):
+        cls._chats.pop(chat_id, None)
+
+    @classmethod
+    def invalidate_room(cls, room_code: str):
+        """Forget every user and chat currently resolved to a room"""
+        for cache in (cls._users, cls._chats):
+            for key in [k for k, (_, code) in cache.items() if code == room_code]:
+                del cache[key]
+
+    @classmethod
+    def stats(cls) -> dict:
+        """Hit/miss counters for the admin dashboard"""
+        lookups = cls.hits + cls.misses
+        return {
+            "hits": cls.hits,
+            "misses": cls.misses,
+            "hit_rate": round(cls.hits / lookups * 100, 1) if lookups else 0.0,
+            "users": len(cls._users),
+            "chats": len(cls._chats),
+        }
@@ -1,12 +1,21 @@
 from db.mongo import get_database
-from bot.models.models import Room
-from typing import Optional, List
+from db.pagination import CREATED_AT_KEYSET, CREATED_AT_SORT, decode_cursor, keyset_filter, paginate
+from bot.models.models import Room, Membership
+from bot.models.records import RoomRecord
+from bot.services.room_resolver import RoomResolver
+from bot.services.room_replica import RoomReplica
+from pymongo.errors import DuplicateKeyError
+from typing import Optional, List, Tuple
 import string
 import random
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Member listings page by user_id, served by the (room_code, user_id) index
+MEMBER_KEYSET = ["user_id"]
+MEMBER_SORT = [("user_id", -1)]
+
 
 class RoomService:
     @staticmethod
@@ -32,10 +41,11 @@ class RoomService:
             name=name,
             description=description,
             owner_id=owner_id,
-            members=[owner_id]
+            member_count=1
         )
         
         await db.rooms.insert_one(room.model_dump())
+        await db.memberships.insert_one(Membership(room_code=code, user_id=owner_id).model_dump())
         logger.info(f"Created room {code} by user {owner_id}")
         
         return room
@@ -43,6 +53,10 @@ class RoomService:
     @staticmethod
     async def get_room(code: str) -> Optional[Room]:
         """Get room by code"""
+        if RoomReplica.ready:
+            room_data = RoomReplica.get(code)
+            return Room(**room_data) if room_data else None
+        
         db = get_database()
         room_data = await db.rooms.find_one({"code": code, "is_active": True})
         return Room(**room_data) if room_data else None
@@ -50,29 +64,63 @@ class RoomService:
     @staticmethod
     async def get_room_by_chat_id(chat_id: int) -> Optional[Room]:
         """Get room by linked Telegram chat ID"""
+        if RoomReplica.ready:
+            room_data = RoomReplica.get_by_chat_id(chat_id)
+            return Room(**room_data) if room_data else None
+        
         db = get_database()
         room_data = await db.rooms.find_one({"linked_chat_id": chat_id, "is_active": True})
         return Room(**room_data) if room_data else None
 
     @staticmethod
     async def join_room(code: str, user_id: int) -> bool:
-        """Add user to room"""
+        """Add user to room. Returns True if the user was not already a member"""
         db = get_database()
-        result = await db.rooms.update_one(
-            {"code": code, "is_active": True},
-            {"$addToSet": {"members": user_id}}
-        )
-        return result.modified_count > 0 or result.matched_count > 0
+        if RoomReplica.ready:
+            exists = RoomReplica.get(code) is not None
+        else:
+            exists = await db.rooms.count_documents({"code": code, "is_active": True}, limit=1) > 0
+        if not exists:
+            return False
+        
+        try:
+            await db.memberships.insert_one(Membership(room_code=code, user_id=user_id).model_dump())
+        except DuplicateKeyError:
+            return False
+        
+        await db.rooms.update_one({"code": code}, {"$inc": {"member_count": 1}})
+        return True
 
     @staticmethod
     async def leave_room(code: str, user_id: int) -> bool:
         """Remove user from room"""
         db = get_database()
-        result = await db.rooms.update_one(
-            {"code": code},
-            {"$pull": {"members": user_id}}
-        )
-        return result.modified_count > 0
+        result = await db.memberships.delete_one({"room_code": code, "user_id": user_id})
+        if not result.deleted_count:
+            return False
+        
+        await db.rooms.update_one({"code": code}, {"$inc": {"member_count": -1}})
+        return True
+
+    @staticmethod
+    async def is_member(code: str, user_id: int) -> bool:
+        """Check whether a user is a member of a room"""
+        db = get_database()
+        return await db.memberships.count_documents({"room_code": code, "user_id": user_id}, limit=1) > 0
+
+    @staticmethod
+    async def get_members_page(code: str, cursor: Optional[str] = None,
+                               limit: int = 50) -> Tuple[List[Membership], Optional[str]]:
+        """Get a page of a room's members with keyset pagination"""
+        db = get_database()
+        query = {"room_code": code}
+        values = decode_cursor(cursor, MEMBER_KEYSET) if cursor else None
+        if values:
+            query.update(keyset_filter(MEMBER_KEYSET, values))
+        
+        cursor_ = db.memberships.find(query).sort(MEMBER_SORT).limit(limit + 1)
+        members, next_cursor = paginate(await cursor_.to_list(length=limit + 1), MEMBER_KEYSET, limit)
+        return [Membership(**m) for m in members], next_cursor
 
     @staticmethod
     async def link_chat(code: str, chat_id: int, user_id: int) -> bool:
@@ -83,11 +131,16 @@ class RoomService:
         if not room or room.owner_id != user_id:
             return False
         
-        result = await db.rooms.update_one(
+        # The pre-update document tells which group (if any) was linked before
+        previous = await db.rooms.find_one_and_update(
             {"code": code},
-            {"$set": {"linked_chat_id": chat_id}}
+            {"$set": {"linked_chat_id": chat_id}},
+            projection={"linked_chat_id": 1}
         )
-        return result.modified_count > 0
+        RoomResolver.invalidate_chat(chat_id)
+        if previous and previous.get("linked_chat_id") is not None:
+            RoomResolver.invalidate_chat(previous["linked_chat_id"])
+        return previous is not None and previous.get("linked_chat_id") != chat_id
 
     @staticmethod
     async def disconnect_chat(chat_id: int) -> bool:
@@ -97,6 +150,7 @@ class RoomService:
             {"linked_chat_id": chat_id},
             {"$set": {"linked_chat_id": None}}
         )
+        RoomResolver.invalidate_chat(chat_id)
         return result.modified_count > 0
 
     @staticmethod
@@ -107,6 +161,20 @@ class RoomService:
         rooms = await cursor.to_list(length=limit)
         return [Room(**r) for r in rooms]
 
+    @staticmethod
+    async def get_all_rooms_page(cursor: Optional[str] = None,
+                                 limit: int = 50) -> Tuple[List[RoomRecord], Optional[str]]:
+        """Get a page of active rooms (newest first) with keyset pagination, as listing records"""
+        db = get_database()
+        query = {"is_active": True}
+        values = decode_cursor(cursor, CREATED_AT_KEYSET) if cursor else None
+        if values:
+            query.update(keyset_filter(CREATED_AT_KEYSET, values))
+        
+        cursor_ = db.rooms.find(query, RoomRecord.PROJECTION).sort(CREATED_AT_SORT).limit(limit + 1)
+        rooms, next_cursor = paginate(await cursor_.to_list(length=limit + 1), CREATED_AT_KEYSET, limit)
+        return [RoomRecord(r) for r in rooms], next_cursor
+
     @staticmethod
     async def count_rooms() -> int:
         """Count total active rooms"""
@@ -120,4 +188,5 @@ class RoomService:
         await db.rooms.update_one(
             {"code": code},
             {"$set": {"is_active": False}}
-        )
\ No newline at end of file
+        )
+        RoomResolver.invalidate_room(code)
\ No newline at end of file
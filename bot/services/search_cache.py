@@ -0,0 +1,112 @@
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+from config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Rough in-memory cost of a cached entry and of each file id it holds
+ENTRY_OVERHEAD_BYTES = 512
+ID_BYTES = 96
+
+
+class SearchCache:
+    """
+    In-process cache of search results keyed by (room_code, normalised query, page).
+    Every room has a generation counter that is bumped whenever a file in it is saved
+    or re-tagged; entries remember the generation they were computed at, so a bump
+    invalidates the whole room in O(1) and stale entries are dropped on lookup.
+    Bounded by SEARCH_CACHE_MAX_MB (least recently used entries evicted first).
+    """
+    _entries: "OrderedDict[tuple, Tuple[int, Any, int]]" = OrderedDict()
+    _generations: Dict[str, int] = {}
+    _bytes: int = 0
+    hits: int = 0
+    misses: int = 0
+    stale: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+
+    @staticmethod
+    def normalise(query: str) -> str:
+        """Normalise a query for use in a cache key (search is case-insensitive)"""
+        return query.strip().lower()
+
+    @classmethod
+    def generation(cls, room_code: str) -> int:
+        """
+        Current generation of a room. Read it before running a search and pass it
+        to set(), so results computed while the room changed are never stored.
+        """
+        return cls._generations.get(room_code, 0)
+
+    @classmethod
+    def invalidate(cls, room_code: str):
+        """Invalidate every cached search in a room"""
+        cls._generations[room_code] = cls._generations.get(room_code, 0) + 1
+        cls.invalidations += 1
+
+    @classmethod
+    def _drop(cls, key: tuple):
+        """Remove an entry and release its size"""
+        _, _, size = cls._entries.pop(key)
+        cls._bytes -= size
+
+    @classmethod
+    def get(cls, room_code: str, query: str, page: Hashable) -> Optional[Any]:
+        """Get cached results if they are from the room's current generation"""
+        if not settings.SEARCH_CACHE_ENABLED:
+            return None
+
+        key = (room_code, cls.normalise(query), page)
+        entry = cls._entries.get(key)
+        if entry is None:
+            cls.misses += 1
+            return None
+
+        if entry[0] != cls.generation(room_code):
+            cls._drop(key)
+            cls.stale += 1
+            cls.misses += 1
+            return None
+
+        cls._entries.move_to_end(key)
+        cls.hits += 1
+        return entry[1]
+
+    @classmethod
+    def set(cls, room_code: str, query: str, page: Hashable, value: Any, generation: int, ids: int = 0):
+        """
+        Cache results computed at generation (ids is the number of file ids in value,
+        used to estimate its size). Skipped if the room changed since generation.
+        """
+        if not settings.SEARCH_CACHE_ENABLED or generation != cls.generation(room_code):
+            return
+
+        key = (room_code, cls.normalise(query), page)
+        if key in cls._entries:
+            cls._drop(key)
+
+        size = ENTRY_OVERHEAD_BYTES + ids * ID_BYTES
+        cls._entries[key] = (generation, value, size)
+        cls._bytes += size
+
+        max_bytes = settings.SEARCH_CACHE_MAX_MB * 1024 * 1024
+        while cls._bytes > max_bytes and cls._entries:
+            cls._drop(next(iter(cls._entries)))
+            cls.evictions += 1
+
+    @classmethod
+    def stats(cls) -> dict:
+        """Hit/miss counters for the admin dashboard"""
+        lookups = cls.hits + cls.misses
+        return {
+            "hits": cls.hits,
+            "misses": cls.misses,
+            "stale": cls.stale,
+            "evictions": cls.evictions,
+            "invalidations": cls.invalidations,
+            "hit_rate": round(cls.hits / lookups * 100, 1) if lookups else 0.0,
+            "entries": len(cls._entries),
+            "memory_kb": round(cls._bytes / 1024, 1),
+        }
@@ -1,61 +1,362 @@
+from config import settings
 from db.mongo import get_database
-from bot.models.models import File
-from typing import List
+from db.pagination import decode_cursor, keyset_filter, paginate
+from bot.models.records import FileRecord
+from bot.services.search_cache import SearchCache
+from bot.services.trigram_index import TrigramIndex
+from bot.services.similarity_index import SimilarityIndex
+from datetime import datetime
+from typing import List, Optional, Tuple
+import secrets
+import re
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Queries shorter than this use substring matching instead of the text index
+MIN_TEXT_QUERY_LENGTH = 3
+# Extra relevance for files whose tags exactly match a query term
+TAG_MATCH_BOOST = 10.0
+# Totals above this are reported as "1000+" instead of being counted exactly
+SEARCH_COUNT_CAP = 1000
+
 
 class SearchService:
     @staticmethod
-    async def search_files(room_code: str, query: str, skip: int = 0, limit: int = 10) -> List[File]:
+    def _query_terms(query: str) -> List[str]:
+        """Split a query into lowercase word terms (drops $text operators like quotes and '-')"""
+        return [term.lower() for term in re.findall(r"\w+", query)]
+
+    @staticmethod
+    def _use_text_search(query: str) -> bool:
+        """Short queries (or ones without words) use substring matching only"""
+        terms = SearchService._query_terms(query)
+        return bool(terms) and len(query.strip()) >= MIN_TEXT_QUERY_LENGTH
+
+    @staticmethod
+    def _substring_conditions(room_code: str, query: str) -> dict:
+        """Case-insensitive partial match on tags, file name and caption"""
+        pattern = re.escape(query.strip())
+        return {
+            "room_code": room_code,
+            "$or": [
+                {"tags": {"$regex": pattern, "$options": "i"}},
+                {"ai_tags": {"$regex": pattern, "$options": "i"}},
+                {"file_name": {"$regex": pattern, "$options": "i"}},
+                {"caption": {"$regex": pattern, "$options": "i"}}
+            ]
+        }
+
+    @staticmethod
+    def _text_conditions(room_code: str, query: str) -> Tuple[dict, List[str]]:
+        """Full-text match on the room-prefixed text index"""
+        terms = SearchService._query_terms(query)
+        return {"room_code": room_code, "$text": {"$search": " ".join(terms)}}, terms
+
+    @staticmethod
+    def _match_conditions(room_code: str, query: str) -> dict:
+        """Match stage for either search mode"""
+        if SearchService._use_text_search(query):
+            return SearchService._text_conditions(room_code, query)[0]
+        return SearchService._substring_conditions(room_code, query)
+
+    @staticmethod
+    def _substring_stages(room_code: str, query: str) -> Tuple[List[dict], dict]:
+        """Match stage plus the sort stage for a MongoDB substring search, newest first"""
+        conditions = SearchService._substring_conditions(room_code, query)
+        return [{"$match": conditions}], {"$sort": {"created_at": -1, "_id": -1}}
+
+    @staticmethod
+    def _ranked_stages(room_code: str, query: str) -> Tuple[List[dict], dict]:
+        """
+        Build the match and scoring stages plus the sort stage for a text-index search,
+        ranked by relevance (textScore, exact tag matches boosted)
+        """
+        conditions, terms = SearchService._text_conditions(room_code, query)
+        stages = [
+            {"$match": conditions},
+            {"$addFields": {
+                "score": {"$add": [
+                    {"$meta": "textScore"},
+                    {"$cond": [
+                        {"$gt": [
+                            {"$size": {"$setIntersection": [
+                                {"$concatArrays": [
+                                    {"$ifNull": ["$tags", []]},
+                                    {"$ifNull": ["$ai_tags", []]}
+                                ]},
+                                terms
+                            ]}},
+                            0
+                        ]},
+                        TAG_MATCH_BOOST,
+                        0
+                    ]}
+                ]}
+            }}
+        ]
+        return stages, {"$sort": {"score": -1, "created_at": -1, "_id": -1}}
+
+    @staticmethod
+    async def _substring_ids(room_code: str, query: str) -> list:
+        """_ids of substring matches newest first, from the trigram index or else a MongoDB regex scan"""
+        keys = await TrigramIndex.search(room_code, query)
+        if keys is not None:
+            return [key[1] for key in keys[:SEARCH_COUNT_CAP + 1]]
+        
+        db = get_database()
+        stages, sort = SearchService._substring_stages(room_code, query)
+        pipeline = stages + [sort, {"$limit": SEARCH_COUNT_CAP + 1}, {"$project": {"_id": 1}}]
+        matches = await db.files.aggregate(pipeline).to_list(length=SEARCH_COUNT_CAP + 1)
+        return [m["_id"] for m in matches]
+
+    @staticmethod
+    async def _ranked_ids(room_code: str, query: str) -> list:
         """
-        Search files in a room by:
-        - Tags (case-insensitive partial match)
-        - File name (case-insensitive partial match)
-        - Caption (case-insensitive partial match)
+        Up to SEARCH_COUNT_CAP + 1 matching _ids, best first.
+        Word queries rank whole-word text-index matches first, followed by files that only
+        contain the query as a substring (e.g. "chap" in "chapter") from the trigram index.
+        Without the trigram index, substring matches are only used when no word matches.
         """
+        if not SearchService._use_text_search(query):
+            return await SearchService._substring_ids(room_code, query)
+        
         db = get_database()
+        stages, sort = SearchService._ranked_stages(room_code, query)
+        pipeline = stages + [sort, {"$limit": SEARCH_COUNT_CAP + 1}, {"$project": {"_id": 1}}]
+        ranked = [m["_id"] for m in await db.files.aggregate(pipeline).to_list(length=SEARCH_COUNT_CAP + 1)]
         
-        # Build search query
-        search_conditions = {
-            "$and": [
-                {"room_code": room_code},
-                {
-                    "$or": [
-                        {"tags": {"$regex": query, "$options": "i"}},
-                        {"ai_tags": {"$regex": query, "$options": "i"}},
-                        {"file_name": {"$regex": query, "$options": "i"}},
-                        {"caption": {"$regex": query, "$options": "i"}}
-                    ]
-                }
-            ]
-        }
+        keys = await TrigramIndex.search(room_code, query)
+        if keys is None:
+            return ranked or await SearchService._substring_ids(room_code, query)
         
-        cursor = db.files.find(search_conditions).skip(skip).limit(limit).sort("created_at", -1)
-        files = await cursor.to_list(length=limit)
+        seen = set(ranked)
+        for _, file_id in keys:
+            if len(ranked) > SEARCH_COUNT_CAP:
+                break
+            if file_id not in seen:
+                ranked.append(file_id)
+        return ranked
+
+    @staticmethod
+    async def _ranking(room_code: str, query: str) -> Tuple[list, bool]:
+        """
+        Ranked _ids of up to SEARCH_COUNT_CAP matches and whether more matched.
+        Cached per room generation, so repeated popular queries skip the search.
+        """
+        cached = SearchCache.get(room_code, query, "ranking")
+        if cached is not None:
+            return cached
+        
+        generation = SearchCache.generation(room_code)
+        matches = await SearchService._ranked_ids(room_code, query)
+        capped = len(matches) > SEARCH_COUNT_CAP
+        file_ids = matches[:SEARCH_COUNT_CAP]
+        SearchCache.set(room_code, query, "ranking", (file_ids, capped), generation, ids=len(file_ids))
+        return file_ids, capped
+
+    @staticmethod
+    async def _fetch_by_ids(ids: list) -> List[FileRecord]:
+        """Fetch listing records for files by _id, preserving the order of ids"""
+        db = get_database()
+        docs = await db.files.find({"_id": {"$in": ids}}, FileRecord.PROJECTION).to_list(length=len(ids))
+        by_id = {doc["_id"]: doc for doc in docs}
+        return [FileRecord(by_id[i]) for i in ids if i in by_id]
+
+    @staticmethod
+    async def search_files(room_code: str, query: str, skip: int = 0, limit: int = 10) -> List[FileRecord]:
+        """
+        Search files in a room, ranked like /search (see _ranked_ids).
+        Pages are slices of the cached ranking, so only the first SEARCH_COUNT_CAP
+        matches can be listed.
+        """
+        file_ids, _ = await SearchService._ranking(room_code, query)
+        file_ids = file_ids[skip:skip + limit]
         
-        logger.info(f"Search '{query}' in room {room_code} returned {len(files)} results")
+        logger.info(f"Search '{query}' in room {room_code} returned {len(file_ids)} results")
         
-        return [File(**f) for f in files]
+        return await SearchService._fetch_by_ids(file_ids)
 
     @staticmethod
-    async def count_search_results(room_code: str, query: str) -> int:
-        """Count search results"""
+    async def search_files_page(room_code: str, query: str, cursor: Optional[str] = None,
+                                limit: int = 10) -> Tuple[List[FileRecord], Optional[str]]:
+        """
+        Search files in a room with keyset pagination on the ranking sort key instead of
+        $skip: (score, created_at, _id) for word queries, which page through whole-word
+        text-index matches, and (created_at, _id) for substring queries, served from the
+        trigram index when it is available. Returns (files, next cursor).
+        """
         db = get_database()
         
-        search_conditions = {
-            "$and": [
-                {"room_code": room_code},
-                {
-                    "$or": [
-                        {"tags": {"$regex": query, "$options": "i"}},
-                        {"ai_tags": {"$regex": query, "$options": "i"}},
-                        {"file_name": {"$regex": query, "$options": "i"}},
-                        {"caption": {"$regex": query, "$options": "i"}}
-                    ]
-                }
+        page = ("cursor", cursor, limit)
+        cached = SearchCache.get(room_code, query, page)
+        if cached is not None:
+            file_ids, next_cursor = cached
+            return await SearchService._fetch_by_ids(file_ids), next_cursor
+        
+        generation = SearchCache.generation(room_code)
+        text_search = SearchService._use_text_search(query)
+        if text_search:
+            stages, sort = SearchService._ranked_stages(room_code, query)
+        else:
+            stages, sort = SearchService._substring_stages(room_code, query)
+        fields = list(sort["$sort"].keys())
+        values = decode_cursor(cursor, fields) if cursor else None
+        
+        keys = None if text_search else await TrigramIndex.search(room_code, query)
+        if keys is not None:
+            # Substring matches are ordered by (created_at, _id), the same keyset
+            if values:
+                keys = [key for key in keys if key < tuple(values)]
+            docs = [{"created_at": key[0], "_id": key[1]} for key in keys[:limit + 1]]
+            matches, next_cursor = paginate(docs, fields, limit)
+            file_ids = [m["_id"] for m in matches]
+            files = await SearchService._fetch_by_ids(file_ids)
+        else:
+            if values:
+                stages.append({"$match": keyset_filter(fields, values)})
+            # Keep the sort key fields for the cursor alongside the listed ones
+            project = {**FileRecord.PROJECTION, **{field: 1 for field in fields}}
+            pipeline = stages + [sort, {"$limit": limit + 1}, {"$project": project}]
+            docs = await db.files.aggregate(pipeline).to_list(length=limit + 1)
+            docs, next_cursor = paginate(docs, fields, limit)
+            file_ids = [f["_id"] for f in docs]
+            files = [FileRecord(f) for f in docs]
+        
+        SearchCache.set(room_code, query, page, (file_ids, next_cursor), generation, ids=len(file_ids))
+        
+        return files, next_cursor
+
+    @staticmethod
+    async def search_with_total(room_code: str, query: str, skip: int = 0,
+                                limit: int = 10) -> Tuple[List[FileRecord], int, bool]:
+        """
+        Search files and count matches in a single aggregation ($facet).
+        The count stops at SEARCH_COUNT_CAP. Returns (files, total, capped).
+        With the trigram index enabled, substring matches are merged in memory (see
+        _ranked_ids), so the page and total are taken from the cached ranking instead.
+        """
+        if settings.TRIGRAM_INDEX_ENABLED:
+            file_ids, capped = await SearchService._ranking(room_code, query)
+            files = await SearchService._fetch_by_ids(file_ids[skip:skip + limit])
+            return files, len(file_ids), capped
+        
+        db = get_database()
+        
+        page = ("total", skip, limit)
+        cached = SearchCache.get(room_code, query, page)
+        if cached is not None:
+            file_ids, total, capped = cached
+            return await SearchService._fetch_by_ids(file_ids), total, capped
+        
+        generation = SearchCache.generation(room_code)
+        builders = [SearchService._substring_stages]
+        if SearchService._use_text_search(query):
+            # Like sessions, word queries fall back to substring matching when no word matches
+            builders.insert(0, SearchService._ranked_stages)
+        for build in builders:
+            stages, sort = build(room_code, query)
+            pipeline = stages + [
+                {"$facet": {
+                    "results": [sort, {"$skip": skip}, {"$limit": limit}, {"$project": FileRecord.PROJECTION}],
+                    "total": [{"$limit": SEARCH_COUNT_CAP + 1}, {"$count": "count"}]
+                }}
             ]
-        }
+            result = await db.files.aggregate(pipeline).to_list(length=1)
+            facets = result[0] if result else {"results": [], "total": []}
+            if facets["total"]:
+                break
+        
+        total = facets["total"][0]["count"] if facets["total"] else 0
+        capped = total > SEARCH_COUNT_CAP
+        total = min(total, SEARCH_COUNT_CAP)
+        
+        logger.info(f"Search '{query}' in room {room_code} returned {len(facets['results'])} results")
+        
+        file_ids = [f["_id"] for f in facets["results"]]
+        SearchCache.set(room_code, query, page, (file_ids, total, capped), generation, ids=len(file_ids))
+        
+        return [FileRecord(f) for f in facets["results"]], total, capped
+
+    @staticmethod
+    async def create_session(room_code: str, query: str,
+                             limit: int = 10) -> Tuple[Optional[str], List[FileRecord], int, bool]:
+        """
+        Run a search once and store the ordered list of matching file ids under a short
+        opaque token, so later pages are slices of that list instead of re-searches.
+        Returns (token, first page, total, capped); token is None when nothing matched.
+        """
+        db = get_database()
+        
+        file_ids, capped = await SearchService._ranking(room_code, query)
+        logger.info(f"Search '{query}' in room {room_code} matched {len(file_ids)} files")
+        
+        if not file_ids:
+            return None, [], 0, False
         
-        return await db.files.count_documents(search_conditions)
\ No newline at end of file
+        token = secrets.token_hex(6)
+        await db.search_sessions.insert_one({
+            "token": token,
+            "room_code": room_code,
+            "query": query,
+            "file_ids": file_ids,
+            "total": len(file_ids),
+            "capped": capped,
+            "created_at": datetime.utcnow()
+        })
+        
+        files = await SearchService._fetch_by_ids(file_ids[:limit])
+        return token, files, len(file_ids), capped
+
+    @staticmethod
+    async def get_session_page(token: str, page: int,
+                               limit: int = 10) -> Optional[Tuple[str, str, List[FileRecord], int, bool]]:
+        """
+        Get one page of a stored search session.
+        Returns (query, room_code, files, total, capped), or None if the session has expired.
+        """
+        db = get_database()
+        
+        session = await db.search_sessions.find_one(
+            {"token": token},
+            {"query": 1, "room_code": 1, "total": 1, "capped": 1,
+             "file_ids": {"$slice": [page * limit, limit]}}
+        )
+        if not session:
+            return None
+        
+        files = await SearchService._fetch_by_ids(session["file_ids"])
+        return session["query"], session["room_code"], files, session["total"], session["capped"]
+
+    @staticmethod
+    async def similar_files(room_code: str, file_id: str, limit: int = 5,
+                            file_unique_id: Optional[str] = None) -> Optional[List[Tuple[FileRecord, float]]]:
+        """
+        Files in the room most similar to the given file (TF-IDF cosine over name, caption,
+        tags and cached extracted text), as (file, score) best first.
+        Returns None if the file is not in the room.
+        """
+        db = get_database()
+        
+        query = {"room_code": room_code, "file_id": file_id}
+        if file_unique_id:
+            query = {"room_code": room_code, "$or": [{"file_unique_id": file_unique_id}, {"file_id": file_id}]}
+        file_data = await db.files.find_one(query, {"_id": 1})
+        if not file_data:
+            return None
+        
+        matches = await SimilarityIndex.similar(room_code, file_data["_id"], limit)
+        ids = [file_id for file_id, _ in matches]
+        docs = await db.files.find({"_id": {"$in": ids}}, FileRecord.PROJECTION).to_list(length=len(ids))
+        by_id = {doc["_id"]: doc for doc in docs}
+        
+        return [(FileRecord(by_id[i]), score) for i, score in matches if i in by_id]
+
+    @staticmethod
+    async def count_search_results(room_code: str, query: str) -> int:
+        """Count search results"""
+        file_ids, capped = await SearchService._ranking(room_code, query)
+        if not capped:
+            return len(file_ids)
+        db = get_database()
+        return await db.files.count_documents(SearchService._match_conditions(room_code, query))
@@ -0,0 +1,316 @@
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+from config import settings
+from db.mongo import get_database
+from bot.services.search_cache import SearchCache
+import numpy as np
+import asyncio
+import re
+import zlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Hashed feature space (power of two); collisions only blur rare terms
+FEATURE_BITS = 18
+FEATURE_DIM = 1 << FEATURE_BITS
+# How much each field counts toward a file's term frequencies
+FIELD_WEIGHTS = {"tags": 3, "ai_tags": 3, "file_name": 2, "caption": 1, "text": 1}
+# Only the start of extracted text is used, so long documents don't dominate
+MAX_TEXT_CHARS = 20000
+# Rebuild a room's matrix once this share of its rows are superseded
+COMPACT_RATIO = 0.25
+
+INDEXED_FIELDS = {"tags": 1, "ai_tags": 1, "file_name": 1, "caption": 1, "file_unique_id": 1}
+
+
+def _tokens(text: str) -> List[str]:
+    return [t for t in re.findall(r"[^\W_]+", text.lower()) if len(t) > 1]
+
+
+def _term_counts(fields: Dict[str, str]) -> Counter:
+    """Weighted counts of hashed terms in the given fields"""
+    counts = Counter()
+    for field, value in fields.items():
+        for token in _tokens(value):
+            counts[zlib.crc32(token.encode("utf-8")) & (FEATURE_DIM - 1)] += FIELD_WEIGHTS[field]
+    return counts
+
+
+def _file_fields(doc: dict, text: Optional[str] = None) -> Dict[str, str]:
+    return {
+        "tags": " ".join(doc.get("tags") or []),
+        "ai_tags": " ".join(doc.get("ai_tags") or []),
+        "file_name": doc.get("file_name") or "",
+        "caption": doc.get("caption") or "",
+        "text": (text or "")[:MAX_TEXT_CHARS],
+    }
+
+
+def _to_arrays(counts: Counter) -> Tuple[np.ndarray, np.ndarray]:
+    """Sorted (feature indices, counts) arrays of a row"""
+    indices = np.fromiter(counts.keys(), dtype=np.int32, count=len(counts))
+    values = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+    order = np.argsort(indices)
+    return indices[order], values[order]
+
+
+class RoomSimilarityIndex:
+    """
+    TF-IDF matrix over one room's files, stored as CSR arrays (indptr, indices, data)
+    of hashed term counts. Sublinear TF and IDF weights are applied at query time from a
+    document-frequency vector, so new rows are appended without touching existing ones.
+    Superseded rows (re-tagged files) are masked out and dropped by compaction.
+    """
+
+    def __init__(self):
+        self.ids: List[object] = []
+        self.row_by_id: Dict[object, int] = {}
+        self.alive = np.zeros(0, dtype=bool)
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int32)
+        self.data = np.zeros(0, dtype=np.float32)
+        self.df = np.zeros(FEATURE_DIM, dtype=np.int32)
+        self._pending: "OrderedDict[object, Tuple[np.ndarray, np.ndarray]]" = OrderedDict()
+        self.dead = 0
+
+    @property
+    def size(self) -> int:
+        return len(self.row_by_id) + len(self._pending)
+
+    def add(self, doc: dict, text: Optional[str] = None):
+        """Queue a new file; rows are appended in batches on the next query"""
+        self._queue(doc["_id"], _to_arrays(_term_counts(_file_fields(doc, text))))
+
+    def add_tags(self, file_id, tags: List[str]):
+        """Add newly added tags to a file's row, keeping its other terms (including extracted text)"""
+        row = self._current_row(file_id)
+        if row is None:
+            return
+        counts = Counter(dict(zip(row[0].tolist(), row[1].tolist())))
+        counts.update(_term_counts({"tags": " ".join(tags)}))
+        self._queue(file_id, _to_arrays(counts))
+
+    def _current_row(self, file_id) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        if file_id in self._pending:
+            return self._pending[file_id]
+        row = self.row_by_id.get(file_id)
+        if row is None:
+            return None
+        start, end = self.indptr[row], self.indptr[row + 1]
+        return self.indices[start:end], self.data[start:end]
+
+    def _queue(self, file_id, row: Tuple[np.ndarray, np.ndarray]):
+        """Replace any previous version of the file's row with row"""
+        previous = self._pending.pop(file_id, None)
+        if previous is not None:
+            self.df[previous[0]] -= 1
+        else:
+            old = self.row_by_id.pop(file_id, None)
+            if old is not None:
+                self.alive[old] = False
+                self.df[self.indices[self.indptr[old]:self.indptr[old + 1]]] -= 1
+                self.dead += 1
+        self.df[row[0]] += 1
+        self._pending[file_id] = row
+
+    def _flush(self):
+        """Append pending rows to the CSR arrays, compacting if many rows are dead"""
+        if self._pending:
+            start = len(self.ids)
+            rows = list(self._pending.values())
+            lengths = np.array([len(indices) for indices, _ in rows], dtype=np.int64)
+            self.indptr = np.concatenate([self.indptr, self.indptr[-1] + np.cumsum(lengths)])
+            self.indices = np.concatenate([self.indices] + [indices for indices, _ in rows])
+            self.data = np.concatenate([self.data] + [counts for _, counts in rows])
+            self.alive = np.concatenate([self.alive, np.ones(len(rows), dtype=bool)])
+            for offset, file_id in enumerate(self._pending):
+                self.ids.append(file_id)
+                self.row_by_id[file_id] = start + offset
+            self._pending = OrderedDict()
+
+        if self.dead > 32 and self.dead > len(self.ids) * COMPACT_RATIO:
+            self.compact()
+
+    def compact(self):
+        """Rebuild the CSR arrays without superseded rows"""
+        rows = np.flatnonzero(self.alive)
+        lengths = np.diff(self.indptr)[rows]
+        keep = np.repeat(self.alive, np.diff(self.indptr))
+        self.indices = self.indices[keep]
+        self.data = self.data[keep]
+        self.indptr = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        self.ids = [self.ids[r] for r in rows]
+        self.row_by_id = {file_id: row for row, file_id in enumerate(self.ids)}
+        self.alive = np.ones(len(self.ids), dtype=bool)
+        self.dead = 0
+
+    def _idf(self) -> np.ndarray:
+        n = self.size
+        return (np.log((1.0 + n) / (1.0 + self.df)) + 1.0).astype(np.float32)
+
+    def _row_sums(self, values: np.ndarray) -> np.ndarray:
+        """Sum values (one per stored feature) within each row"""
+        sums = np.zeros(len(self.ids), dtype=np.float32)
+        nonempty = np.flatnonzero(np.diff(self.indptr))
+        if len(nonempty):
+            sums[nonempty] = np.add.reduceat(values, self.indptr[nonempty])
+        return sums
+
+    def similar(self, file_id, k: int) -> List[Tuple[object, float]]:
+        """Top-k files by TF-IDF cosine similarity to file_id, as (_id, score)"""
+        self._flush()
+        row = self.row_by_id.get(file_id)
+        if row is None or not len(self.ids):
+            return []
+
+        idf = self._idf()
+        weighted = (1.0 + np.log(self.data)) * idf[self.indices]
+        norms = np.sqrt(self._row_sums(weighted * weighted))
+
+        start, end = self.indptr[row], self.indptr[row + 1]
+        query = np.zeros(FEATURE_DIM, dtype=np.float32)
+        query[self.indices[start:end]] = weighted[start:end]
+
+        scores = self._row_sums(weighted * query[self.indices])
+        denominator = norms * norms[row]
+        scores = np.divide(scores, denominator, out=np.zeros_like(scores), where=denominator > 0)
+        scores[~self.alive] = 0.0
+        scores[row] = 0.0
+
+        k = min(k, len(scores) - 1)
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[r], float(scores[r])) for r in top if scores[r] > 0]
+
+    def memory_bytes(self) -> int:
+        arrays = (self.alive, self.indptr, self.indices, self.data, self.df)
+        return sum(a.nbytes for a in arrays) + len(self.ids) * 120
+
+    @classmethod
+    def build(cls, docs: List[dict], texts: Dict[str, bytes]) -> "RoomSimilarityIndex":
+        """
+        Build an index from file documents and their compressed extracted text (by
+        file_unique_id). CPU-bound: run it in a worker thread, not on the event loop.
+        """
+        index = cls()
+        for doc in docs:
+            compressed = texts.get(doc.get("file_unique_id"))
+            text = zlib.decompress(compressed).decode("utf-8") if compressed else None
+            index.add(doc, text)
+        index._flush()
+        return index
+
+
+class SimilarityIndex:
+    """
+    Per-room "more like this" indexes, computed locally with NumPy (no embedding service).
+    A room's matrix is built on its first /similar request from file names, captions,
+    tags and any cached extracted text, then kept current by FileService on upload and
+    tagging. Least recently used rooms are evicted above SIMILARITY_INDEX_MAX_MB.
+    """
+    _rooms: "OrderedDict[str, RoomSimilarityIndex]" = OrderedDict()
+    _loading: Dict[str, "asyncio.Future"] = {}
+    loads: int = 0
+    queries: int = 0
+    evictions: int = 0
+
+    @classmethod
+    async def _load(cls, room_code: str) -> Optional[RoomSimilarityIndex]:
+        """Build a room's index from MongoDB (single-flight per room)"""
+        loading = cls._loading.get(room_code)
+        if loading is not None:
+            return await asyncio.shield(loading)
+
+        future = asyncio.get_running_loop().create_future()
+        cls._loading[room_code] = future
+        try:
+            generation = SearchCache.generation(room_code)
+            db = get_database()
+            docs = await db.files.find({"room_code": room_code}, INDEXED_FIELDS).to_list(length=None)
+
+            texts = {}
+            unique_ids = [d["file_unique_id"] for d in docs if d.get("file_unique_id")]
+            if unique_ids:
+                cursor = db.extracted_text.find({"file_unique_id": {"$in": unique_ids}}, {"file_unique_id": 1, "text": 1})
+                async for entry in cursor:
+                    texts[entry["file_unique_id"]] = entry["text"]
+
+            # Tokenising and decompressing a large room takes seconds; keep the bot responsive
+            index = await asyncio.to_thread(RoomSimilarityIndex.build, docs, texts)
+
+            # A file saved or tagged during the load may be missing; use it once but don't keep it
+            if generation != SearchCache.generation(room_code):
+                future.set_result(index)
+                return index
+
+            cls._rooms[room_code] = index
+            cls.loads += 1
+            logger.info(f"Loaded similarity index for room {room_code} ({index.size} files)")
+            cls._evict(keep=room_code)
+            future.set_result(index)
+            return index
+        except BaseException as e:
+            if not future.done():
+                future.set_result(None)
+            if not isinstance(e, Exception):
+                raise
+            logger.warning(f"Similarity index load failed for room {room_code}: {e}")
+            return None
+        finally:
+            cls._loading.pop(room_code, None)
+
+    @classmethod
+    def _evict(cls, keep: str):
+        """Drop least recently used rooms until the indexes fit SIMILARITY_INDEX_MAX_MB"""
+        max_bytes = settings.SIMILARITY_INDEX_MAX_MB * 1024 * 1024
+        while sum(i.memory_bytes() for i in cls._rooms.values()) > max_bytes and len(cls._rooms) > 1:
+            room_code = next(iter(cls._rooms))
+            if room_code == keep:
+                cls._rooms.move_to_end(room_code)
+                continue
+            del cls._rooms[room_code]
+            cls.evictions += 1
+            logger.info(f"Evicted similarity index for room {room_code}")
+
+    @classmethod
+    async def similar(cls, room_code: str, file_id, k: int) -> List[Tuple[object, float]]:
+        """Top-k (_id, score) of files in the room most similar to the file with _id file_id"""
+        index = cls._rooms.get(room_code)
+        if index is None:
+            index = await cls._load(room_code)
+            if index is None:
+                return []
+        else:
+            cls._rooms.move_to_end(room_code)
+
+        cls.queries += 1
+        return index.similar(file_id, k)
+
+    @classmethod
+    def add_file(cls, room_code: str, doc: dict):
+        """Index a saved file if its room is loaded"""
+        index = cls._rooms.get(room_code)
+        if index is not None:
+            index.add(doc)
+
+    @classmethod
+    def add_tags(cls, room_code: str, file_id, tags: List[str]):
+        """Add new tags to a file's row if its room is loaded"""
+        index = cls._rooms.get(room_code)
+        if index is not None:
+            index.add_tags(file_id, tags)
+
+    @classmethod
+    def stats(cls) -> dict:
+        """Loaded rooms and memory for the admin dashboard"""
+        return {
+            "rooms": len(cls._rooms),
+            "files": sum(i.size for i in cls._rooms.values()),
+            "memory_kb": round(sum(i.memory_bytes() for i in cls._rooms.values()) / 1024, 1),
+            "loads": cls.loads,
+            "queries": cls.queries,
+            "evictions": cls.evictions,
+        }
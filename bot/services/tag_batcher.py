@@ -0,0 +1,103 @@
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from config import settings
+from bot.services.ai_service import AIService
+from bot.services.file_service import FileService
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Called with a file's suggested tags once its batch completes
+TagsCallback = Callable[[List[str]], Awaitable[None]]
+
+
+class TagBatcher:
+    """
+    Micro-batches AI tag suggestions for uploads.
+    Captions arriving in the same room within AI_TAG_BATCH_WINDOW seconds are tagged
+    with one LLM call, and the tags are written back to their files with one bulk write,
+    so a burst of uploads costs one round-trip instead of one per file.
+    """
+    _pending: Dict[str, List[Tuple[str, str, Optional[TagsCallback]]]] = {}
+    _timers: Dict[str, "asyncio.Task"] = {}
+    _tasks: set = set()
+    batches: int = 0
+    batched_files: int = 0
+
+    @classmethod
+    def submit(cls, room_code: str, file_unique_id: str, caption: str,
+               on_tags: Optional[TagsCallback] = None):
+        """Queue a file's caption for tagging; returns immediately"""
+        pending = cls._pending.setdefault(room_code, [])
+        pending.append((file_unique_id, caption, on_tags))
+
+        if len(pending) >= settings.AI_TAG_BATCH_MAX:
+            timer = cls._timers.pop(room_code, None)
+            if timer is not None:
+                timer.cancel()
+            cls._spawn(cls._flush(room_code))
+        elif room_code not in cls._timers:
+            cls._timers[room_code] = cls._spawn(cls._flush_later(room_code))
+
+    @classmethod
+    def _spawn(cls, coro) -> "asyncio.Task":
+        """Run a batch in the background, keeping a reference until it finishes"""
+        task = asyncio.create_task(coro)
+        cls._tasks.add(task)
+        task.add_done_callback(cls._tasks.discard)
+        return task
+
+    @classmethod
+    async def _flush_later(cls, room_code: str):
+        await asyncio.sleep(settings.AI_TAG_BATCH_WINDOW)
+        cls._timers.pop(room_code, None)
+        await cls._flush(room_code)
+
+    @classmethod
+    async def _flush(cls, room_code: str):
+        """Tag every queued caption of a room with one LLM call and one bulk write"""
+        batch = cls._pending.pop(room_code, [])
+        if not batch:
+            return
+
+        try:
+            suggestions = await AIService.suggest_tags_batch([caption for _, caption, _ in batch])
+            await FileService.add_ai_tags_bulk(
+                room_code, {unique_id: tags for (unique_id, _, _), tags in zip(batch, suggestions)}
+            )
+        except Exception as e:
+            logger.error(f"Batched tag suggestion failed for room {room_code}: {e}")
+            return
+
+        cls.batches += 1
+        cls.batched_files += len(batch)
+        logger.info(f"Tagged {len(batch)} uploads in room {room_code} with one AI call")
+
+        for (_, _, on_tags), tags in zip(batch, suggestions):
+            if on_tags and tags:
+                try:
+                    await on_tags(tags)
+                except Exception as e:
+                    logger.warning(f"Tag notification failed: {e}")
+
+    @classmethod
+    async def shutdown(cls):
+        """
+        Flush queued captions immediately and wait for batches already running.
+        Call it while the bot can still edit messages and the AI client is open.
+        """
+        for timer in list(cls._timers.values()):
+            timer.cancel()
+        cls._timers.clear()
+        await asyncio.gather(*(cls._flush(room_code) for room_code in list(cls._pending)), return_exceptions=True)
+        await asyncio.gather(*cls._tasks, return_exceptions=True)
+
+    @classmethod
+    def stats(cls) -> dict:
+        """Batching counters for the admin settings page"""
+        return {
+            "batches": cls.batches,
+            "batched_files": cls.batched_files,
+            "files_per_batch": round(cls.batched_files / cls.batches, 1) if cls.batches else 0.0,
+            "queued": sum(len(p) for p in cls._pending.values()),
+        }
@@ -0,0 +1,74 @@
+from db.mongo import get_database
+from pymongo import UpdateOne
+from datetime import datetime
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TagService:
+    """
+    Per-room tag frequencies kept in the room_tags collection, one document per
+    (room_code, tag). Counts are incremented as files are saved and tagged, so a
+    room's vocabulary is a single indexed read instead of a scan of its files.
+    """
+
+    @staticmethod
+    async def increment(room_code: str, tags: Iterable[str]):
+        """Count each tag once more in a room (one file gained these tags)"""
+        await TagService.increment_many(room_code, [tags])
+
+    @staticmethod
+    async def increment_many(room_code: str, tag_lists: Iterable[Iterable[str]]):
+        """Count tags gained by several files in a room with one bulk write"""
+        counts = Counter()
+        for tags in tag_lists:
+            counts.update(dict.fromkeys(tag for tag in tags if tag))
+        if not counts:
+            return
+        
+        db = get_database()
+        now = datetime.utcnow()
+        await db.room_tags.bulk_write([
+            UpdateOne(
+                {"room_code": room_code, "tag": tag},
+                {"$inc": {"count": count}, "$set": {"updated_at": now}},
+                upsert=True
+            )
+            for tag, count in counts.items()
+        ], ordered=False)
+
+    @staticmethod
+    async def get_top_tags(room_code: str, limit: int = 30) -> List[Tuple[str, int]]:
+        """Most used tags in a room as (tag, count)"""
+        db = get_database()
+        cursor = db.room_tags.find({"room_code": room_code}, {"tag": 1, "count": 1}).sort("count", -1).limit(limit)
+        return [(t["tag"], t["count"]) async for t in cursor]
+
+    @staticmethod
+    async def suggest_tags(room_code: str, prefix: str, limit: int = 5) -> List[Tuple[str, int]]:
+        """Tags in a room starting with prefix, most used first (autocomplete)"""
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        
+        db = get_database()
+        cursor = db.room_tags.find(
+            {"room_code": room_code, "tag": {"$regex": f"^{re.escape(prefix)}"}},
+            {"tag": 1, "count": 1}
+        ).sort("count", -1).limit(limit)
+        return [(t["tag"], t["count"]) async for t in cursor]
+
+    @staticmethod
+    async def get_tag_counts(room_code: str, tags: Iterable[str]) -> Dict[str, int]:
+        """Room-wide file counts for the given tags (facets)"""
+        tags = list(dict.fromkeys(tags))
+        if not tags:
+            return {}
+        
+        db = get_database()
+        cursor = db.room_tags.find({"room_code": room_code, "tag": {"$in": tags}}, {"tag": 1, "count": 1})
+        return {t["tag"]: t["count"] async for t in cursor}
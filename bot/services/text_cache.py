@@ -0,0 +1,128 @@
+from datetime import datetime
+from typing import Optional
+from pymongo import ReturnDocument
+from config import settings
+from db.mongo import get_database
+import zlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Document in cache_stats holding the running total of compressed bytes
+SIZE_COUNTER_ID = "extracted_text"
+
+
+class TextCache:
+    """
+    Persistent cache of text extracted from Telegram documents, keyed by file_unique_id.
+    Text is stored zlib-compressed; least-recently-used entries are evicted
+    once the collection exceeds TEXT_CACHE_MAX_MB, tracked by a running total in
+    cache_stats so writes never scan the collection. Partial extractions record
+    how much text they hold, so a caller needing more re-extracts.
+    """
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @classmethod
+    async def get(cls, file_unique_id: str, min_chars: int) -> Optional[str]:
+        """
+        Get cached text for a file if it is complete or holds at least min_chars,
+        and mark it as recently used
+        """
+        try:
+            db = get_database()
+            entry = await db.extracted_text.find_one_and_update(
+                {
+                    "file_unique_id": file_unique_id,
+                    "$or": [{"complete": True}, {"chars": {"$gte": min_chars}}]
+                },
+                {"$set": {"last_used_at": datetime.utcnow()}},
+                projection={"text": 1}
+            )
+        except Exception as e:
+            logger.warning(f"Extracted text cache lookup failed: {e}")
+            entry = None
+
+        if not entry:
+            cls.misses += 1
+            return None
+
+        cls.hits += 1
+        return zlib.decompress(entry["text"]).decode("utf-8")
+
+    @classmethod
+    async def set(cls, file_unique_id: str, text: str, complete: bool = True):
+        """Store extracted text for a file"""
+        compressed = zlib.compress(text.encode("utf-8"))
+        now = datetime.utcnow()
+
+        try:
+            db = get_database()
+            previous = await db.extracted_text.find_one_and_update(
+                {"file_unique_id": file_unique_id},
+                {
+                    "$set": {
+                        "text": compressed,
+                        "size": len(compressed),
+                        "chars": len(text),
+                        "complete": complete,
+                        "last_used_at": now
+                    },
+                    "$setOnInsert": {"created_at": now}
+                },
+                projection={"size": 1},
+                upsert=True
+            )
+            old_size = previous.get("size", 0) if previous else 0
+            total = await cls._add_size(len(compressed) - old_size)
+            await cls._evict(total)
+        except Exception as e:
+            logger.warning(f"Extracted text cache write failed: {e}")
+
+    @staticmethod
+    async def _add_size(delta: int) -> int:
+        """Adjust the running size total and return the new total"""
+        db = get_database()
+        counter = await db.cache_stats.find_one_and_update(
+            {"_id": SIZE_COUNTER_ID},
+            {"$inc": {"size": delta}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return counter["size"]
+
+    @classmethod
+    async def _evict(cls, total: int):
+        """Delete least-recently-used entries until the cache fits its size cap"""
+        max_bytes = settings.TEXT_CACHE_MAX_MB * 1024 * 1024
+        if total <= max_bytes:
+            return
+
+        db = get_database()
+        excess = total - max_bytes
+        freed = 0
+        evicted = 0
+        while freed < excess:
+            # Each delete returns the entry it removed, so the total stays exact under concurrent writers
+            entry = await db.extracted_text.find_one_and_delete({}, projection={"size": 1}, sort=[("last_used_at", 1)])
+            if entry is None:
+                break
+            freed += entry.get("size", 0)
+            evicted += 1
+
+        if evicted:
+            await cls._add_size(-freed)
+            cls.evictions += evicted
+            logger.info(f"Evicted {evicted} entries from extracted text cache")
+
+    @classmethod
+    def stats(cls) -> dict:
+        """Hit/miss counters for the admin dashboard"""
+        lookups = cls.hits + cls.misses
+        return {
+            "hits": cls.hits,
+            "misses": cls.misses,
+            "evictions": cls.evictions,
+            "hit_rate": round(cls.hits / lookups * 100, 1) if lookups else 0.0,
+        }
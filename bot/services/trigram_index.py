@@ -0,0 +1,243 @@
+from array import array
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from config import settings
+from db.mongo import get_database
+from bot.services.search_cache import SearchCache
+import asyncio
+import sys
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Fields matched by substring search, in the order they are joined
+INDEXED_FIELDS = {"tags": 1, "ai_tags": 1, "file_name": 1, "caption": 1, "created_at": 1}
+# Separates fields/tags so a match never spans two of them
+FIELD_SEPARATOR = "\x00"
+# Rebuild a room's postings once this share of its slots are superseded
+COMPACT_RATIO = 0.5
+
+
+def _searchable_text(doc: dict) -> str:
+    """Lowercased tags, AI tags, file name and caption of a file, separated"""
+    parts = list(doc.get("tags") or []) + list(doc.get("ai_tags") or [])
+    parts += [doc.get("file_name") or "", doc.get("caption") or ""]
+    return FIELD_SEPARATOR.join(parts).lower()
+
+
+def _trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class RoomTrigramIndex:
+    """
+    Trigram inverted index over one room's files.
+    Each file occupies a slot; postings are array('I') lists of slot numbers, which stay
+    sorted because slots are only appended. Re-tagging a file supersedes its old slot
+    with a new one, and superseded slots are dropped by periodic compaction.
+    """
+
+    def __init__(self):
+        self.texts: List[Optional[str]] = []
+        self.keys: List[Tuple[datetime, object]] = []
+        self.slot_by_id: Dict[object, int] = {}
+        self.postings: Dict[str, array] = {}
+        self.dead = 0
+        self.bytes = 0
+
+    def add(self, doc: dict):
+        """Index a new file, or re-index one whose tags changed"""
+        old = self.slot_by_id.get(doc["_id"])
+        if old is not None:
+            self.bytes -= sys.getsizeof(self.texts[old])
+            self.texts[old] = None
+            self.dead += 1
+
+        created_at = doc.get("created_at") or datetime.min
+        # MongoDB stores milliseconds; match that so keys agree with reloaded ones and cursors
+        created_at = created_at.replace(microsecond=created_at.microsecond // 1000 * 1000)
+        self._add_text(doc["_id"], created_at, _searchable_text(doc))
+
+        if self.dead > 64 and self.dead > len(self.texts) * COMPACT_RATIO:
+            self.compact()
+
+    def _add_text(self, file_id, created_at: datetime, text: str):
+        """Append a slot and its postings, tracking approximate memory"""
+        slot = len(self.texts)
+        self.texts.append(text)
+        self.keys.append((created_at, file_id))
+        self.slot_by_id[file_id] = slot
+        # text, key tuple with datetime and ObjectId, list and dict slots
+        self.bytes += sys.getsizeof(text) + 200
+        for gram in _trigrams(text):
+            posting = self.postings.get(gram)
+            if posting is None:
+                posting = self.postings[gram] = array("I")
+                self.bytes += sys.getsizeof(gram) + sys.getsizeof(posting) + 16
+            posting.append(slot)
+            self.bytes += posting.itemsize
+
+    def compact(self):
+        """Rebuild postings without superseded slots"""
+        live = [(text, key) for text, key in zip(self.texts, self.keys) if text is not None]
+        self.texts, self.keys, self.slot_by_id, self.postings = [], [], {}, {}
+        self.dead = self.bytes = 0
+        for text, (created_at, file_id) in live:
+            self._add_text(file_id, created_at, text)
+
+    @classmethod
+    def build(cls, docs: List[dict]) -> "RoomTrigramIndex":
+        """Build an index from file documents. CPU-bound: run it in a worker thread, not on the event loop."""
+        index = cls()
+        for doc in docs:
+            index.add(doc)
+        return index
+
+    def search(self, query: str) -> List[Tuple[datetime, object]]:
+        """
+        (created_at, _id) keys of files whose fields contain query, newest first.
+        Candidates come from intersecting the query's trigram postings and are then
+        verified against the stored text; queries under 3 characters scan every file.
+        """
+        query = query.lower()
+        grams = _trigrams(query)
+        if grams:
+            postings = []
+            for gram in grams:
+                posting = self.postings.get(gram)
+                if posting is None:
+                    return []
+                postings.append(posting)
+            postings.sort(key=len)
+            candidates = set(postings[0])
+            for posting in postings[1:]:
+                candidates.intersection_update(posting)
+                if not candidates:
+                    return []
+        else:
+            candidates = range(len(self.texts))
+
+        matches = [
+            self.keys[slot] for slot in candidates
+            if self.texts[slot] is not None and query in self.texts[slot]
+        ]
+        matches.sort(reverse=True)
+        return matches
+
+
+class TrigramIndex:
+    """
+    In-process trigram indexes serving substring search, one per room.
+    A room's index is loaded lazily on its first substring search and kept current
+    by FileService on save and tagging. Least recently searched rooms are evicted
+    once all indexes together exceed TRIGRAM_INDEX_MAX_MB.
+    """
+    _rooms: "OrderedDict[str, RoomTrigramIndex]" = OrderedDict()
+    _loading: Dict[str, "asyncio.Future"] = {}
+    _memory: Dict[str, int] = {}
+    loads: int = 0
+    queries: int = 0
+    evictions: int = 0
+
+    @classmethod
+    async def _load(cls, room_code: str) -> Optional[RoomTrigramIndex]:
+        """Build a room's index from MongoDB (single-flight per room)"""
+        loading = cls._loading.get(room_code)
+        if loading is not None:
+            return await asyncio.shield(loading)
+
+        future = asyncio.get_running_loop().create_future()
+        cls._loading[room_code] = future
+        try:
+            generation = SearchCache.generation(room_code)
+            db = get_database()
+            cursor = db.files.find({"room_code": room_code}, INDEXED_FIELDS).sort([("created_at", 1), ("_id", 1)])
+            docs = await cursor.to_list(length=None)
+            # Indexing a large room takes seconds; keep the bot responsive
+            index = await asyncio.to_thread(RoomTrigramIndex.build, docs)
+
+            # A file saved or tagged during the load may be missing, so don't install it
+            if generation != SearchCache.generation(room_code):
+                future.set_result(None)
+                return None
+
+            cls._rooms[room_code] = index
+            cls._memory[room_code] = index.bytes
+            cls.loads += 1
+            logger.info(f"Loaded trigram index for room {room_code} ({len(index.texts)} files)")
+            cls._evict(keep=room_code)
+            future.set_result(index)
+            return index
+        except BaseException as e:
+            if not future.done():
+                future.set_result(None)
+            if not isinstance(e, Exception):
+                raise
+            logger.warning(f"Trigram index load failed for room {room_code}: {e}")
+            return None
+        finally:
+            cls._loading.pop(room_code, None)
+
+    @classmethod
+    def _evict(cls, keep: str):
+        """Drop least recently used rooms until the indexes fit TRIGRAM_INDEX_MAX_MB"""
+        max_bytes = settings.TRIGRAM_INDEX_MAX_MB * 1024 * 1024
+        while sum(cls._memory.values()) > max_bytes and len(cls._rooms) > 1:
+            room_code = next(iter(cls._rooms))
+            if room_code == keep:
+                cls._rooms.move_to_end(room_code)
+                continue
+            del cls._rooms[room_code]
+            cls._memory.pop(room_code, None)
+            cls.evictions += 1
+            logger.info(f"Evicted trigram index for room {room_code}")
+
+    @classmethod
+    async def search(cls, room_code: str, query: str) -> Optional[List[Tuple[datetime, object]]]:
+        """
+        Substring search in a room, newest first, as (created_at, _id) keys.
+        Returns None if the index is disabled or could not be loaded.
+        """
+        if not settings.TRIGRAM_INDEX_ENABLED:
+            return None
+
+        index = cls._rooms.get(room_code)
+        if index is None:
+            index = await cls._load(room_code)
+            if index is None:
+                return None
+        else:
+            cls._rooms.move_to_end(room_code)
+
+        cls.queries += 1
+        return index.search(query.strip())
+
+    @classmethod
+    def add_file(cls, room_code: str, doc: dict):
+        """Index a saved or re-tagged file if its room is loaded"""
+        index = cls._rooms.get(room_code)
+        if index is not None:
+            index.add(doc)
+            cls._memory[room_code] = index.bytes
+            cls._evict(keep=room_code)
+
+    @classmethod
+    def stats(cls) -> dict:
+        """Per-room memory for the admin dashboard"""
+        rooms = [
+            {
+                "room_code": room_code,
+                "files": len(index.slot_by_id),
+                "trigrams": len(index.postings),
+                "memory_kb": round(cls._memory.get(room_code, 0) / 1024, 1),
+            }
+            for room_code, index in reversed(cls._rooms.items())
+        ]
+        return {
+            "rooms": rooms,
+            "memory_kb": round(sum(cls._memory.values()) / 1024, 1),
+            "loads": cls.loads,
+            "queries": cls.queries,
+            "evictions": cls.evictions,
+        }
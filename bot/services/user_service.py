@@ -1,6 +1,9 @@
 from db.mongo import get_database
+from db.pagination import CREATED_AT_KEYSET, CREATED_AT_SORT, decode_cursor, keyset_filter, paginate
 from bot.models.models import User
-from typing import Optional
+from bot.models.records import UserRecord
+from bot.services.room_resolver import RoomResolver
+from typing import Dict, List, Optional, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
@@ -40,6 +43,7 @@ class UserService:
             {"user_id": user_id},
             {"$set": {"current_room_code": room_code}}
         )
+        RoomResolver.invalidate_user(user_id)
 
     @staticmethod
     async def get_user(user_id: int) -> Optional[User]:
@@ -48,6 +52,13 @@ class UserService:
         user_data = await db.users.find_one({"user_id": user_id})
         return User(**user_data) if user_data else None
 
+    @staticmethod
+    async def get_users(user_ids: List[int]) -> Dict[int, UserRecord]:
+        """Get listing records for several users in one query, keyed by user ID"""
+        db = get_database()
+        cursor = db.users.find({"user_id": {"$in": user_ids}}, UserRecord.PROJECTION)
+        return {u["user_id"]: UserRecord(u) async for u in cursor}
+
     @staticmethod
     async def is_admin(user_id: int) -> bool:
         """Check if user is admin"""
@@ -62,6 +73,18 @@ class UserService:
         users = await cursor.to_list(length=limit)
         return [User(**u) for u in users]
 
+    @staticmethod
+    async def get_all_users_page(cursor: Optional[str] = None,
+                                 limit: int = 50) -> Tuple[List[UserRecord], Optional[str]]:
+        """Get a page of users (newest first) with keyset pagination, as listing records"""
+        db = get_database()
+        values = decode_cursor(cursor, CREATED_AT_KEYSET) if cursor else None
+        query = keyset_filter(CREATED_AT_KEYSET, values) if values else {}
+        
+        cursor_ = db.users.find(query, UserRecord.PROJECTION).sort(CREATED_AT_SORT).limit(limit + 1)
+        users, next_cursor = paginate(await cursor_.to_list(length=limit + 1), CREATED_AT_KEYSET, limit)
+        return [UserRecord(u) for u in users], next_cursor
+
     @staticmethod
     async def count_users() -> int:
         """Count total users"""
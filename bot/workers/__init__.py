@@ -0,0 +1,3 @@
+from .extraction import extract_pdf_text, init_worker, iter_pdf_pages
+
+__all__ = ["extract_pdf_text", "init_worker", "iter_pdf_pages"]
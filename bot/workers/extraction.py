@@ -0,0 +1,57 @@
+"""
+PDF text extraction run inside ExtractionService's worker processes.
+Workers unpickle these functions by module path, so this module must stay free of
+the bot.services package (and its numpy, motor and httpx imports): every worker
+imports it under the EXTRACTION_MEMORY_LIMIT_MB address-space cap.
+"""
+from typing import Iterator, Tuple, Union
+import mmap
+import io
+
+
+def init_worker(memory_limit_mb: int):
+    """Cap the address space of an extraction worker (POSIX only)"""
+    try:
+        import resource
+    except ImportError:
+        return
+    if memory_limit_mb > 0:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def iter_pdf_pages(pdf_reader, max_pages: int) -> Iterator[str]:
+    """Lazily yield the text of each page, parsing a page only when it is requested"""
+    for index in range(min(len(pdf_reader.pages), max_pages)):
+        yield pdf_reader.pages[index].extract_text() or ""
+
+
+def extract_pdf_text(source: Union[bytes, str], max_chars: int, max_pages: int) -> Tuple[str, bool]:
+    """
+    Extract PDF text page by page until max_chars is reached (runs in a worker process).
+    source is either the PDF bytes or the path of a spilled download, which is mmapped.
+    Returns (text, complete) where complete is True if every page was read.
+    """
+    if isinstance(source, str):
+        with open(source, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return _read_pdf(mapped, max_chars, max_pages)
+    return _read_pdf(io.BytesIO(source), max_chars, max_pages)
+
+
+def _read_pdf(stream, max_chars: int, max_pages: int) -> Tuple[str, bool]:
+    """Read pages from a PDF stream until max_chars is reached"""
+    import PyPDF2
+    pdf_reader = PyPDF2.PdfReader(stream)
+    
+    pages = []
+    pages_read = 0
+    total = 0
+    for page_text in iter_pdf_pages(pdf_reader, max_pages):
+        pages_read += 1
+        if page_text.strip():
+            pages.append(page_text)
+            total += len(page_text)
+        if total >= max_chars:
+            break
+    
+    return "\n\n".join(pages), pages_read == len(pdf_reader.pages)
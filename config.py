@@ -18,8 +18,80 @@ class Settings(BaseSettings):
     AI_MAX_TOKENS: int = 1000
     AI_TEMPERATURE: float = 0.7
     
+    # AI HTTP client (shared, pooled)
+    AI_HTTP_MAX_CONNECTIONS: int = 20
+    AI_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    AI_HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    AI_HTTP2: bool = True
+    AI_CONNECT_TIMEOUT: float = 5.0
+    AI_READ_TIMEOUT: float = 60.0
+    AI_WRITE_TIMEOUT: float = 10.0
+    AI_POOL_TIMEOUT: float = 10.0
+    
+    # AI outbound limiter (token bucket + adaptive concurrency)
+    AI_RATE_LIMIT_PER_SECOND: float = 5.0
+    AI_RATE_BURST: int = 10
+    AI_CONCURRENCY_INITIAL: int = 8
+    AI_CONCURRENCY_MIN: int = 1
+    AI_CONCURRENCY_MAX: int = 32
+    AI_LATENCY_TARGET: float = 30.0
+    AI_MAX_QUEUE: int = 200
+    AI_QUEUE_TIMEOUT: float = 30.0
+    AI_MAX_RETRIES: int = 2
+    AI_RETRY_AFTER_MAX: float = 30.0
+    
+    # AI streaming (progressive Telegram message edits)
+    AI_STREAMING_ENABLED: bool = True
+    AI_STREAM_EDIT_INTERVAL: float = 1.5
+    
+    # Map-reduce for long documents (comma-separated commands: summarise, explain, quiz)
+    AI_MAP_REDUCE_COMMANDS: str = "summarise"
+    AI_CHUNK_TOKENS: int = 1500
+    AI_CHUNK_SUMMARY_TOKENS: int = 300
+    AI_MAX_CHUNKS: int = 12
+    AI_CHUNK_CONCURRENCY: int = 4
+    
+    # AI tag suggestion batching (uploads per room within the window share one call)
+    AI_TAG_BATCH_WINDOW: float = 2.0
+    AI_TAG_BATCH_MAX: int = 20
+    
+    # AI result cache
+    AI_CACHE_ENABLED: bool = True
+    AI_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    AI_CACHE_MEMORY_SIZE: int = 512
+    
+    # Document downloads (size cap, in-memory threshold before spilling to disk)
+    DOWNLOAD_MAX_MB: int = 20
+    DOWNLOAD_SPOOL_MB: int = 2
+    DOWNLOAD_TIMEOUT: float = 60.0
+    
+    # Document text extraction (process pool)
+    EXTRACTION_WORKERS: int = 2
+    EXTRACTION_TIMEOUT: float = 30.0
+    EXTRACTION_MEMORY_LIMIT_MB: int = 512
+    EXTRACTION_RECYCLE_AFTER: int = 200
+    EXTRACTION_MAX_PAGES: int = 100
+    TEXT_CACHE_MAX_MB: int = 256
+    
     # Rate Limiting
     AI_CALLS_PER_USER_PER_DAY: int = 50
+    AI_QUOTA_SHARD_ENABLED: bool = False
+    AI_QUOTA_SYNC_INTERVAL: float = 5.0
+    
+    # In-memory replica of active rooms fed by a change stream (needs a replica set)
+    ROOM_REPLICA_ENABLED: bool = False
+    
+    # Room resolution cache (user -> current room, group chat -> linked room)
+    ROOM_CACHE_TTL_SECONDS: int = 60
+    ROOM_CACHE_SIZE: int = 10000
+    
+    # Search
+    SEARCH_SESSION_TTL_SECONDS: int = 3600
+    SEARCH_CACHE_ENABLED: bool = True
+    SEARCH_CACHE_MAX_MB: int = 16
+    TRIGRAM_INDEX_ENABLED: bool = True
+    TRIGRAM_INDEX_MAX_MB: int = 128
+    SIMILARITY_INDEX_MAX_MB: int = 256
     
     # Admin Panel
     ADMIN_USERNAME: str = "admin"
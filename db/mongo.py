@@ -19,6 +19,8 @@ class MongoDB:
             
             # Create indexes
             await cls.create_indexes()
+            # Quota reservations upsert today's document, which is only safe with this unique index
+            await cls.create_ai_usage_index()
             
             logger.info("Connected to MongoDB successfully")
         except Exception as e:
@@ -42,25 +44,216 @@ class MongoDB:
             # Users indexes
             await cls.db.users.create_index("user_id", unique=True)
             await cls.db.users.create_index("username")
+            await cls.db.users.create_index([("created_at", -1), ("_id", -1)])
             
             # Rooms indexes
             await cls.db.rooms.create_index("code", unique=True)
             await cls.db.rooms.create_index("owner_id")
             await cls.db.rooms.create_index("linked_chat_id")
+            await cls.db.rooms.create_index([("is_active", 1), ("created_at", -1), ("_id", -1)])
+            
+            # Room membership indexes
+            await cls.db.memberships.create_index([("room_code", 1), ("user_id", 1)], unique=True)
+            await cls.db.memberships.create_index("user_id")
+            await cls.migrate_room_members()
             
             # Files indexes
             await cls.db.files.create_index("room_code")
             await cls.db.files.create_index("uploader_id")
             await cls.db.files.create_index("tags")
-            await cls.db.files.create_index([("file_name", "text"), ("caption", "text")])
+            # Room-scoped lookups by Telegram file ids (tagging, /similar, re-upload dedupe)
+            await cls.db.files.create_index([("room_code", 1), ("file_id", 1)])
+            await cls.create_file_unique_index()
+            # Keyset pagination (newest first) per room and across all files
+            await cls.db.files.create_index([("room_code", 1), ("created_at", -1), ("_id", -1)])
+            await cls.db.files.create_index([("created_at", -1), ("_id", -1)])
+            await cls.create_text_index()
+            
+            # Search session indexes
+            await cls.db.search_sessions.create_index("token", unique=True)
+            await cls.db.search_sessions.create_index(
+                "created_at", expireAfterSeconds=settings.SEARCH_SESSION_TTL_SECONDS
+            )
+            
+            # Extracted document text cache indexes
+            await cls.db.extracted_text.create_index("file_unique_id", unique=True)
+            await cls.db.extracted_text.create_index("last_used_at")
+            await cls.backfill_text_cache_size()
             
-            # AI Usage indexes
-            await cls.db.ai_usage.create_index([("user_id", 1), ("date", -1)])
+            # Per-room tag frequency indexes
+            await cls.db.room_tags.create_index([("room_code", 1), ("tag", 1)], unique=True)
+            await cls.db.room_tags.create_index([("room_code", 1), ("count", -1)])
+            await cls.backfill_room_tags()
+            
+            # AI result cache indexes
+            await cls.db.ai_cache.create_index("key", unique=True)
+            await cls.db.ai_cache.create_index(
+                "created_at", expireAfterSeconds=settings.AI_CACHE_TTL_SECONDS
+            )
             
             logger.info("MongoDB indexes created successfully")
         except Exception as e:
             logger.error(f"Failed to create indexes: {e}")
 
+    @classmethod
+    async def create_text_index(cls):
+        """
+        Create the room-prefixed, weighted text index used by search.
+        A collection allows only one text index, so the older file_name/caption one is dropped first.
+        """
+        existing = await cls.db.files.index_information()
+        if "file_name_text_caption_text" in existing:
+            await cls.db.files.drop_index("file_name_text_caption_text")
+            logger.info("Dropped legacy files text index")
+        
+        await cls.db.files.create_index(
+            [
+                ("room_code", 1),
+                ("tags", "text"),
+                ("ai_tags", "text"),
+                ("file_name", "text"),
+                ("caption", "text")
+            ],
+            weights={"tags": 10, "ai_tags": 5, "file_name": 3, "caption": 1},
+            name="files_text_search"
+        )
+
+    @classmethod
+    async def create_file_unique_index(cls):
+        """
+        Unique (room_code, file_unique_id) index that dedupes re-uploads within a room.
+        Files saved before file_unique_id was recorded are left out by the partial filter.
+        """
+        try:
+            await cls.db.files.create_index(
+                [("room_code", 1), ("file_unique_id", 1)],
+                unique=True,
+                partialFilterExpression={"file_unique_id": {"$exists": True}},
+                name="room_file_unique_id"
+            )
+        except Exception as e:
+            # Duplicates uploaded before this index existed must be removed first
+            logger.warning(f"Could not create unique file index: {e}")
+
+    @classmethod
+    async def create_ai_usage_index(cls):
+        """
+        Unique (user_id, date) index, so quota reservations that upsert today's
+        document can never create a second one. Replaces the older non-unique index.
+        Without it a user at the limit would get a fresh document on every upsert,
+        so failing to build it is fatal.
+        """
+        existing = await cls.db.ai_usage.index_information()
+        legacy = existing.get("user_id_1_date_-1")
+        if legacy and legacy.get("unique"):
+            return
+        
+        await cls.merge_ai_usage_duplicates()
+        try:
+            await cls.db.ai_usage.create_index([("user_id", 1), ("date", -1)], unique=True)
+        except Exception as e:
+            logger.error(f"Could not create unique AI usage index: {e}")
+            raise RuntimeError("Unique (user_id, date) index on ai_usage is required for AI quotas") from e
+        logger.info("Created unique AI usage index")
+
+    @classmethod
+    async def merge_ai_usage_duplicates(cls):
+        """
+        Merge duplicate per-day AI usage documents, left by racing upserts before the
+        unique index existed, into one document per user and day with the summed count.
+        Drops the old non-unique index, whose key pattern the unique one reuses.
+        """
+        existing = await cls.db.ai_usage.index_information()
+        if "user_id_1_date_-1" in existing:
+            await cls.db.ai_usage.drop_index("user_id_1_date_-1")
+            logger.info("Dropped non-unique AI usage index")
+        
+        duplicates = cls.db.ai_usage.aggregate([
+            {"$group": {
+                "_id": {"user_id": "$user_id", "date": "$date"},
+                "ids": {"$push": "$_id"},
+                "count": {"$sum": {"$ifNull": ["$count", 1]}},
+                "documents": {"$sum": 1}
+            }},
+            {"$match": {"documents": {"$gt": 1}}}
+        ], allowDiskUse=True)
+        merged = 0
+        async for group in duplicates:
+            keep, *extra = group["ids"]
+            await cls.db.ai_usage.update_one({"_id": keep}, {"$set": {"count": group["count"]}})
+            await cls.db.ai_usage.delete_many({"_id": {"$in": extra}})
+            merged += len(extra)
+        if merged:
+            logger.info(f"Merged {merged} duplicate AI usage documents")
+
+    @classmethod
+    async def backfill_text_cache_size(cls):
+        """Initialise the extracted text cache's running size total from existing entries"""
+        if await cls.db.cache_stats.count_documents({"_id": "extracted_text"}, limit=1):
+            return
+        
+        result = await cls.db.extracted_text.aggregate([
+            {"$group": {"_id": None, "total": {"$sum": "$size"}}}
+        ]).to_list(1)
+        total = result[0]["total"] if result else 0
+        await cls.db.cache_stats.update_one(
+            {"_id": "extracted_text"}, {"$setOnInsert": {"size": total}}, upsert=True
+        )
+
+    @classmethod
+    async def backfill_room_tags(cls):
+        """Build room_tags from existing files the first time it is created"""
+        if await cls.db.room_tags.estimated_document_count() > 0:
+            return
+        
+        await cls.db.files.aggregate([
+            {"$project": {
+                "room_code": 1,
+                "tag": {"$setUnion": [{"$ifNull": ["$tags", []]}, {"$ifNull": ["$ai_tags", []]}]}
+            }},
+            {"$unwind": "$tag"},
+            {"$group": {"_id": {"room_code": "$room_code", "tag": "$tag"}, "count": {"$sum": 1}}},
+            {"$project": {
+                "_id": 0,
+                "room_code": "$_id.room_code",
+                "tag": "$_id.tag",
+                "count": 1,
+                "updated_at": "$$NOW"
+            }},
+            {"$merge": {"into": "room_tags", "on": ["room_code", "tag"], "whenMatched": "replace"}}
+        ]).to_list(length=None)
+        logger.info("Backfilled room tag counts from files")
+
+    @classmethod
+    async def migrate_room_members(cls):
+        """
+        Move members embedded in room documents into the memberships collection,
+        then replace each array with a member_count. Safe to re-run if interrupted.
+        """
+        if not await cls.db.rooms.count_documents({"members": {"$exists": True}}, limit=1):
+            return
+        
+        await cls.db.rooms.aggregate([
+            {"$match": {"members": {"$exists": True}}},
+            {"$unwind": "$members"},
+            {"$project": {
+                "_id": 0,
+                "room_code": "$code",
+                "user_id": "$members",
+                "joined_at": "$created_at"
+            }},
+            {"$merge": {"into": "memberships", "on": ["room_code", "user_id"], "whenMatched": "keepExisting"}}
+        ]).to_list(length=None)
+        
+        await cls.db.rooms.update_many(
+            {"members": {"$exists": True}},
+            [
+                {"$set": {"member_count": {"$size": {"$ifNull": ["$members", []]}}}},
+                {"$unset": "members"}
+            ]
+        )
+        logger.info("Migrated room members to the memberships collection")
+
     @classmethod
     def get_db(cls) -> AsyncIOMotorDatabase:
         """Get database instance"""
@@ -0,0 +1,67 @@
+from bson import ObjectId, json_util
+from bson.errors import BSONError
+from datetime import datetime
+from typing import List, Optional, Tuple
+import base64
+import binascii
+import json
+
+# Default keyset for newest-first listings
+CREATED_AT_KEYSET = ["created_at", "_id"]
+CREATED_AT_SORT = [("created_at", -1), ("_id", -1)]
+# Types a cursor value may decode to, per keyset field; anything else (e.g. a
+# {"$gt": ...} document) would become a query operator in keyset_filter
+KEYSET_TYPES = {
+    "created_at": (datetime,),
+    "_id": (ObjectId,),
+    "user_id": (int,),
+    "score": (int, float),
+}
+
+
+def encode_cursor(doc: dict, fields: List[str]) -> str:
+    """Build an opaque continuation token from the sort-key values of the last document"""
+    values = [doc.get(field) for field in fields]
+    raw = json_util.dumps(values, json_options=json_util.RELAXED_JSON_OPTIONS)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str, fields: List[str]) -> Optional[list]:
+    """Decode a continuation token, returning None if it is malformed"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json_util.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (binascii.Error, ValueError, UnicodeDecodeError, json.JSONDecodeError,
+            BSONError, IndexError, KeyError, TypeError, OverflowError):
+        # Crafted extended-JSON values (bad $oid, $date, ...) fail inside bson itself
+        return None
+    if not isinstance(values, list) or len(values) != len(fields):
+        return None
+    for field, value in zip(fields, values):
+        if isinstance(value, bool) or not isinstance(value, KEYSET_TYPES.get(field, ())):
+            return None
+    return values
+
+
+def keyset_filter(fields: List[str], values: list) -> dict:
+    """
+    Filter for documents strictly after the cursor in a descending sort on fields,
+    e.g. (created_at, _id) -> created_at < c OR (created_at == c AND _id < i)
+    """
+    clauses = []
+    for idx, field in enumerate(fields):
+        clause = {fields[j]: values[j] for j in range(idx)}
+        clause[field] = {"$lt": values[idx]}
+        clauses.append(clause)
+    return {"$or": clauses}
+
+
+def paginate(docs: list, fields: List[str], limit: int) -> Tuple[list, Optional[str]]:
+    """
+    Trim a result fetched with limit + 1 documents to limit,
+    returning (page, next cursor or None if this is the last page)
+    """
+    if len(docs) <= limit:
+        return docs, None
+    page = docs[:limit]
+    return page, encode_cursor(page[-1], fields)
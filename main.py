@@ -8,6 +8,12 @@ from threading import Thread
 
 from config import settings
 from db.mongo import MongoDB
+from bot.services.ai_service import AIService
+from bot.services.extraction_service import ExtractionService
+from bot.services.tag_batcher import TagBatcher
+from bot.services.ai_quota import AIQuota
+from bot.services.room_replica import RoomReplica
+from bot.services.download_service import DownloadService
 from admin.routes import router as admin_router
 
 # Import all handlers
@@ -81,6 +87,8 @@ async def stop_bot():
     if telegram_app:
         logger.info("Stopping Telegram bot...")
         await telegram_app.updater.stop()
+        # Tag pending uploads while the bot can still edit its replies
+        await TagBatcher.shutdown()
         await telegram_app.stop()
         await telegram_app.shutdown()
         logger.info("Telegram bot stopped")
@@ -95,6 +103,14 @@ async def lifespan(app: FastAPI):
     
     # Connect to MongoDB
     await MongoDB.connect_db()
+    await RoomReplica.start()
+    
+    # Open shared AI HTTP client
+    await AIService.open_client()
+    
+    # Start document download client and extraction workers
+    await DownloadService.open_client()
+    ExtractionService.start()
     
     # Setup and start bot
     await setup_bot()
@@ -107,6 +123,11 @@ async def lifespan(app: FastAPI):
     # Shutdown
     logger.info("Shutting down CollaLearn...")
     await stop_bot()
+    await AIQuota.shutdown()
+    await AIService.close_client()
+    ExtractionService.shutdown()
+    await DownloadService.close_client()
+    await RoomReplica.stop()
     await MongoDB.close_db()
     logger.info("CollaLearn shut down successfully")
 
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Required settings have no defaults; tests never talk to Telegram or a real AI provider
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "test-token")
+os.environ.setdefault("AI_API_KEY", "test-key")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,145 @@
+"""Streaming AI calls against a local fake OpenAI-compatible SSE server"""
+import asyncio
+import json
+
+import pytest
+
+from config import settings
+from bot.services.ai_limiter import AILimiter
+from bot.services.ai_service import AIService, AIServiceError
+
+
+def _sse(content: str) -> bytes:
+    return f"data: {json.dumps({'choices': [{'delta': {'content': content}}]})}\n\n".encode()
+
+
+def _chunk(data: bytes) -> bytes:
+    return f"{len(data):x}\r\n".encode() + data + b"\r\n"
+
+
+class FakeProvider:
+    """Minimal HTTP/1.1 server; the request path selects the response scenario"""
+
+    def __init__(self):
+        self.server = None
+        self.requests = []
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.server.close()
+        await self.server.wait_closed()
+
+    def url(self, scenario: str) -> str:
+        port = self.server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}/{scenario}"
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        request_line = (await reader.readline()).decode()
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode().strip()
+            if not line:
+                break
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(headers.get("content-length", 0)))
+        self.requests.append(json.loads(body))
+
+        scenario = request_line.split()[1].strip("/")
+        await getattr(self, scenario)(writer)
+
+    async def stream(self, writer):
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                     b"Transfer-Encoding: chunked\r\n\r\n")
+        for content in ("Hel", "lo ", "world"):
+            writer.write(_chunk(_sse(content)))
+            await writer.drain()
+            await asyncio.sleep(0.01)
+        writer.write(_chunk(b": keep-alive comment\n\ndata: [DONE]\n\n"))
+        # Anything after [DONE] must be ignored
+        writer.write(_chunk(_sse("ignored")))
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        writer.close()
+
+    async def plain(self, writer):
+        body = json.dumps({"choices": [{"message": {"content": "Full answer"}}]}).encode()
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                     + f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+        await writer.drain()
+        writer.close()
+
+    async def interrupted(self, writer):
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                     b"Transfer-Encoding: chunked\r\n\r\n")
+        writer.write(_chunk(_sse("Partial ")))
+        await writer.drain()
+        await asyncio.sleep(0.01)
+        # Drop the connection without the terminating chunk
+        writer.transport.abort()
+
+
+@pytest.fixture(autouse=True)
+def fresh_client(monkeypatch):
+    monkeypatch.setattr(settings, "AI_HTTP2", False)
+    monkeypatch.setattr(settings, "AI_MAX_RETRIES", 0)
+    AIService.client = None
+    AILimiter._condition = None
+    AILimiter.in_flight = 0
+    yield
+    AIService.client = None
+    AILimiter._condition = None
+
+
+def _run(scenario: str, monkeypatch, call):
+    async def main():
+        async with FakeProvider() as provider:
+            monkeypatch.setattr(settings, "AI_API_URL", provider.url(scenario))
+            try:
+                return await call(), provider.requests
+            finally:
+                await AIService.close_client()
+    return asyncio.run(main())
+
+
+def test_stream_yields_incremental_deltas_until_done(monkeypatch):
+    deltas = []
+
+    async def on_chunk(delta):
+        deltas.append(delta)
+
+    messages = [{"role": "user", "content": "hi"}]
+    result, requests = _run("stream", monkeypatch,
+                            lambda: AIService._streamed_call(messages, 50, on_chunk))
+
+    assert deltas == ["Hel", "lo ", "world"]
+    assert result == "Hello world"
+    assert requests[0]["stream"] is True
+    assert AILimiter.in_flight == 0
+
+
+def test_plain_json_response_is_used_when_provider_does_not_stream(monkeypatch):
+    async def collect():
+        return [delta async for delta in AIService._stream_api([{"role": "user", "content": "hi"}])]
+
+    deltas, _ = _run("plain", monkeypatch, collect)
+
+    assert deltas == ["Full answer"]
+
+
+def test_stream_interrupted_mid_response_raises(monkeypatch):
+    deltas = []
+
+    async def on_chunk(delta):
+        deltas.append(delta)
+
+    messages = [{"role": "user", "content": "hi"}]
+    with pytest.raises(AIServiceError, match="interrupted"):
+        _run("interrupted", monkeypatch, lambda: AIService._streamed_call(messages, 50, on_chunk))
+
+    # Text already shown is not silently replaced by a second, non-streaming call
+    assert deltas == ["Partial "]
+    assert AILimiter.in_flight == 0
@@ -0,0 +1,72 @@
+import base64
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from db.pagination import CREATED_AT_KEYSET, decode_cursor, encode_cursor, keyset_filter, paginate
+
+
+def _token(raw: str) -> str:
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def test_cursor_round_trip():
+    doc = {"created_at": datetime(2025, 1, 2, 3, 4, 5, 678000), "_id": ObjectId()}
+
+    values = decode_cursor(encode_cursor(doc, CREATED_AT_KEYSET), CREATED_AT_KEYSET)
+
+    assert values == [doc["created_at"], doc["_id"]]
+
+
+@pytest.mark.parametrize("raw", [
+    '[{"$oid": "zz"}, 1]',
+    '[{"$date": "bad"}, 1]',
+    '[{"$date": {}}, 1]',
+    '[{"$date": 1e400}, 1]',
+    '[{"$date": {"$numberLong": "99999999999999999"}}, 1]',
+    '[{"$binary": "zz"}, 1]',
+    '[{"$timestamp": 1}, 1]',
+    '[1]',
+    '{"a": 1}',
+    'not json',
+])
+def test_malformed_cursor_decodes_to_none(raw):
+    assert decode_cursor(_token(raw), CREATED_AT_KEYSET) is None
+
+
+@pytest.mark.parametrize("raw", [
+    '[{"$gt": {"$date": "2025-01-01T00:00:00Z"}}, {"$oid": "0123456789abcdef01234567"}]',
+    '[{"$date": "2025-01-01T00:00:00Z"}, {"$ne": null}]',
+    '[{"$date": "2025-01-01T00:00:00Z"}, "0123456789abcdef01234567"]',
+    '[1, 1]',
+    '[null, {"$oid": "0123456789abcdef01234567"}]',
+])
+def test_cursor_values_of_the_wrong_type_decode_to_none(raw):
+    assert decode_cursor(_token(raw), CREATED_AT_KEYSET) is None
+
+
+def test_cursor_value_types_follow_the_keyset():
+    assert decode_cursor(_token('[12.5, {"$date": 0}, {"$oid": "0123456789abcdef01234567"}]'),
+                         ["score", "created_at", "_id"]) is not None
+    assert decode_cursor(_token('[42]'), ["user_id"]) == [42]
+    assert decode_cursor(_token('[true]'), ["user_id"]) is None
+    assert decode_cursor(_token('["42"]'), ["user_id"]) is None
+
+
+def test_garbage_token_decodes_to_none():
+    assert decode_cursor("%%%", CREATED_AT_KEYSET) is None
+
+
+def test_keyset_filter_and_paginate():
+    docs = [{"created_at": datetime(2025, 1, i), "_id": ObjectId()} for i in (5, 4, 3)]
+
+    page, cursor = paginate(docs, CREATED_AT_KEYSET, 2)
+
+    assert page == docs[:2]
+    created_at, file_id = decode_cursor(cursor, CREATED_AT_KEYSET)
+    assert (created_at, file_id) == (docs[1]["created_at"], docs[1]["_id"])
+    assert keyset_filter(CREATED_AT_KEYSET, [created_at, file_id]) == {
+        "$or": [{"created_at": {"$lt": created_at}}, {"created_at": created_at, "_id": {"$lt": file_id}}]
+    }
+    assert paginate(docs, CREATED_AT_KEYSET, 3) == (docs, None)
@@ -0,0 +1,180 @@
+"""
+RoomReplica tests. Change-stream tests need a replica set (a single node is enough):
+
+    docker run -d -p 27017:27017 mongo:7 --replSet rs0 && \\
+        docker exec <id> mongosh --eval 'rs.initiate()'
+    TEST_MONGODB_URI="mongodb://localhost:27017/?directConnection=true" pytest tests/test_room_replica.py
+"""
+import asyncio
+import os
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import AutoReconnect
+
+from config import settings
+from db.mongo import MongoDB
+from bot.services import room_replica, room_service
+from bot.services.room_replica import RoomReplica
+from bot.services.room_service import RoomService
+
+TEST_MONGODB_URI = os.environ.get("TEST_MONGODB_URI")
+requires_replica_set = pytest.mark.skipif(not TEST_MONGODB_URI, reason="TEST_MONGODB_URI not set")
+
+
+@pytest.fixture(autouse=True)
+def fresh_replica(monkeypatch):
+    monkeypatch.setattr(settings, "ROOM_REPLICA_ENABLED", True)
+    monkeypatch.setattr(room_replica, "RECONNECT_DELAY", 0.05)
+    RoomReplica._by_code, RoomReplica._by_chat, RoomReplica._code_by_id = {}, {}, {}
+    RoomReplica._resume_token = None
+    RoomReplica._task = None
+    RoomReplica.ready = False
+    RoomReplica.events = RoomReplica.bootstraps = RoomReplica.reconnects = 0
+    yield
+
+
+def _room(code: str, chat_id=None, active=True) -> dict:
+    return {"_id": ObjectId(), "code": code, "name": code, "owner_id": 1,
+            "linked_chat_id": chat_id, "is_active": active}
+
+
+def test_events_move_linked_chats_and_drop_inactive_rooms():
+    a, b = _room("A", chat_id=5), _room("B")
+    RoomReplica._handle({"operationType": "insert", "fullDocument": a})
+    RoomReplica._handle({"operationType": "insert", "fullDocument": b})
+
+    # The chat is relinked from A to B, and A's later unlink doesn't detach it from B
+    RoomReplica._handle({"operationType": "update", "fullDocument": {**b, "linked_chat_id": 5}})
+    RoomReplica._handle({"operationType": "update", "fullDocument": {**a, "linked_chat_id": None}})
+    assert RoomReplica.get_by_chat_id(5)["code"] == "B"
+
+    RoomReplica._handle({"operationType": "update", "fullDocument": {**b, "linked_chat_id": 5, "is_active": False}})
+    assert RoomReplica.get("B") is None
+    assert RoomReplica.get_by_chat_id(5) is None
+
+    RoomReplica._handle({"operationType": "delete", "documentKey": {"_id": a["_id"]}})
+    assert RoomReplica.get("A") is None
+
+
+def test_invalidate_event_requires_a_new_scan():
+    RoomReplica.ready = True
+
+    assert RoomReplica._handle({"operationType": "drop"}) is False
+    assert RoomReplica.ready is False
+
+
+def test_join_room_is_validated_from_the_ready_replica(monkeypatch):
+    calls = []
+
+    class Collection:
+        def __init__(self, name):
+            self.name = name
+
+        def __getattr__(self, method):
+            async def call(*args, **kwargs):
+                calls.append((self.name, method))
+            return call
+
+    monkeypatch.setattr(room_service, "get_database",
+                        lambda: SimpleNamespace(rooms=Collection("rooms"), memberships=Collection("memberships")))
+    RoomReplica._handle({"operationType": "insert", "fullDocument": _room("OPEN")})
+    RoomReplica.ready = True
+
+    assert asyncio.run(RoomService.join_room("OPEN", 7)) is True
+    assert asyncio.run(RoomService.join_room("MISSING", 7)) is False
+    assert calls == [("memberships", "insert_one"), ("rooms", "update_one")]
+
+
+async def _wait_for(condition, timeout: float = 10.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("condition not met in time")
+        await asyncio.sleep(0.02)
+
+
+def _with_database(test):
+    """Run test(db) against a throwaway database on the test replica set"""
+    async def main():
+        MongoDB.client = AsyncIOMotorClient(TEST_MONGODB_URI)
+        MongoDB.db = MongoDB.client[f"collalearn_test_{uuid.uuid4().hex[:8]}"]
+        try:
+            await test(MongoDB.db)
+        finally:
+            await RoomReplica.stop()
+            await MongoDB.client.drop_database(MongoDB.db.name)
+            MongoDB.client.close()
+            MongoDB.client = MongoDB.db = None
+    asyncio.run(main())
+
+
+@requires_replica_set
+def test_bootstrap_loads_active_rooms():
+    async def test(db):
+        await db.rooms.insert_many([_room("ACTIVE1", chat_id=-100), _room("GONE", active=False)])
+
+        await RoomReplica.start()
+        await _wait_for(lambda: RoomReplica.ready)
+
+        assert RoomReplica.get("ACTIVE1")["linked_chat_id"] == -100
+        assert RoomReplica.get_by_chat_id(-100)["code"] == "ACTIVE1"
+        assert RoomReplica.get("GONE") is None
+        assert RoomReplica.bootstraps == 1
+
+    _with_database(test)
+
+
+@requires_replica_set
+def test_updates_and_deactivation_propagate_through_the_stream():
+    async def test(db):
+        await db.rooms.insert_one(_room("ROOM1"))
+        await RoomReplica.start()
+        await _wait_for(lambda: RoomReplica.ready)
+
+        await db.rooms.update_one({"code": "ROOM1"}, {"$set": {"linked_chat_id": -200}})
+        await _wait_for(lambda: RoomReplica.get_by_chat_id(-200) is not None)
+
+        await db.rooms.insert_one(_room("ROOM2"))
+        await _wait_for(lambda: RoomReplica.get("ROOM2") is not None)
+
+        await db.rooms.update_one({"code": "ROOM1"}, {"$set": {"is_active": False}})
+        await _wait_for(lambda: RoomReplica.get("ROOM1") is None)
+        assert RoomReplica.get_by_chat_id(-200) is None
+
+    _with_database(test)
+
+
+@requires_replica_set
+def test_resumes_from_the_last_token_after_a_stream_error(monkeypatch):
+    async def test(db):
+        await db.rooms.insert_one(_room("ROOM1"))
+        await RoomReplica.start()
+        await _wait_for(lambda: RoomReplica.ready)
+
+        # Establish a resume token, then fail while handling the next event
+        await db.rooms.update_one({"code": "ROOM1"}, {"$set": {"name": "renamed"}})
+        await _wait_for(lambda: RoomReplica.get("ROOM1")["name"] == "renamed")
+
+        handle = RoomReplica._handle.__func__
+        failures = []
+
+        def flaky_handle(cls, change):
+            if not failures:
+                failures.append(change)
+                raise AutoReconnect("connection reset")
+            return handle(cls, change)
+
+        monkeypatch.setattr(RoomReplica, "_handle", classmethod(flaky_handle))
+        await db.rooms.update_one({"code": "ROOM1"}, {"$set": {"linked_chat_id": -300}})
+
+        # The failed event is replayed from the resume token, without a new scan
+        await _wait_for(lambda: RoomReplica.get_by_chat_id(-300) is not None)
+        assert failures
+        assert RoomReplica.reconnects == 1
+        assert RoomReplica.bootstraps == 1
+
+    _with_database(test)